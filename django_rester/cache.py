@@ -0,0 +1,246 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Event, Lock
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+
+
+class LRUCache:
+    """Thread-safe in-process cache with LRU eviction and item expiry.
+
+    Every item lives for ttl seconds at most (None - forever), set() also
+    accepts an absolute expires timestamp to cap the item lifetime.
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits, self.misses = 0, 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                if item[1] is None or item[1] > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return item[0]
+                del self._data[key]
+            self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None, expires=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None:
+            ttl_expires = time.time() + ttl
+            expires = ttl_expires if expires is None else min(expires,
+                                                              ttl_expires)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits, self.misses = 0, 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._data)}
+
+    def __len__(self):
+        return len(self._data)
+
+    def peek(self, key, default=None):
+        # not expired value without counting hits and misses
+        item = self._data.get(key)
+        if item is not None and (item[1] is None or item[1] > time.time()):
+            return item[0]
+        return default
+
+    def __contains__(self, key):
+        return self.peek(key) is not None
+
+    async def aget(self, key, default=None):
+        return self.get(key, default)
+
+    async def aset(self, key, value, ttl=None, expires=None):
+        self.set(key, value, ttl, expires)
+
+    async def adelete(self, key):
+        return self.delete(key)
+
+
+class DjangoCache:
+    """The same interface on top of django cache framework.
+
+    Shared between processes, values should be picklable.
+    """
+
+    def __init__(self, alias='default', ttl=None, prefix='django_rester'):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits, self.misses = 0, 0
+
+    def make_key(self, key):
+        return '{}:{}'.format(self.prefix, hashlib.sha1(
+            repr(key).encode('utf-8')).hexdigest())
+
+    def _timeout(self, ttl, expires):
+        ttl = self.ttl if ttl is None else ttl
+        if expires is not None:
+            expires_in = max(expires - time.time(), 0)
+            ttl = expires_in if ttl is None else min(ttl, expires_in)
+        return ttl
+
+    def _count(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get(self, key, default=None):
+        value = self._count(self.cache.get(self.make_key(key)))
+        return default if value is None else value
+
+    def set(self, key, value, ttl=None, expires=None):
+        self.cache.set(self.make_key(key), value,
+                       self._timeout(ttl, expires))
+
+    def delete(self, key):
+        return self.cache.delete(self.make_key(key))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': None}
+
+    async def aget(self, key, default=None):
+        value = self._count(await self.cache.aget(self.make_key(key)))
+        return default if value is None else value
+
+    async def aset(self, key, value, ttl=None, expires=None):
+        await self.cache.aset(self.make_key(key), value,
+                              self._timeout(ttl, expires))
+
+    async def adelete(self, key):
+        return await self.cache.adelete(self.make_key(key))
+
+
+class ResponseCache:
+    """Serialized responses cache on top of LRUCache or DjangoCache.
+
+    Responses are keyed by method, full path (with query string), validated
+    request data and vary_on values: request header names or 'user'
+    (request.user.pk).
+    Concurrent misses of the same key are computed once in the process:
+    the first request holds the key until its response is stored, others
+    wait for it (lock_timeout seconds at most) and take it from the cache.
+    """
+
+    def __init__(self, cache, vary_on=(), lock_timeout=10):
+        self.cache = cache
+        self.vary_on = tuple(vary_on)
+        self.lock_timeout = lock_timeout
+        self._computing = {}  # key -> Event set when response is stored
+        self._lock = Lock()
+
+    def make_key(self, request, request_data):
+        varying = []
+        for item in self.vary_on:
+            if item == 'user':
+                varying.append(getattr(getattr(request, 'user', None),
+                                       'pk', None))
+            else:
+                varying.append(request.headers.get(item))
+        data = json.dumps(request_data, sort_keys=True, default=str)
+        # query params not declared in request_fields (e.g. page) may
+        # change the response as well
+        return (request.method, request.get_full_path(), tuple(varying),
+                hashlib.blake2b(data.encode('utf-8')).hexdigest())
+
+    @staticmethod
+    def _response(cached):
+        if cached is None:
+            return None
+        content, status, content_type = cached
+        return HttpResponse(content, status=status, content_type=content_type)
+
+    @staticmethod
+    def _cached(response):
+        # only complete successful responses are cached
+        if (not isinstance(response, HttpResponse)
+                or response.status_code != 200):
+            return None
+        return response.content, response.status_code, response[
+            'Content-Type']
+
+    def get(self, key):
+        return self._response(self.cache.get(key))
+
+    def acquire(self, key):
+        # Event if the caller computes the response (should be released
+        # with store()), None after waiting for another request
+        with self._lock:
+            event = self._computing.get(key)
+            if event is None:
+                event = self._computing[key] = Event()
+                return event
+        event.wait(self.lock_timeout)
+        return None
+
+    def store(self, key, response, event=None):
+        try:
+            cached = self._cached(response)
+            if cached is not None:
+                self.cache.set(key, cached)
+        finally:
+            self.release(key, event)
+
+    def release(self, key, event):
+        if event is None:
+            return
+        with self._lock:
+            if self._computing.get(key) is event:
+                del self._computing[key]
+        event.set()
+
+    async def aget(self, key):
+        return self._response(await self.cache.aget(key))
+
+    async def aacquire(self, key):
+        with self._lock:
+            event = self._computing.get(key)
+            if event is None:
+                event = self._computing[key] = Event()
+                return event
+        await sync_to_async(event.wait, thread_sensitive=False)(
+            self.lock_timeout)
+        return None
+
+    async def astore(self, key, response, event=None):
+        try:
+            cached = self._cached(response)
+            if cached is not None:
+                await self.cache.aset(key, cached)
+        finally:
+            self.release(key, event)
+
+
+def get_cache(backend=None, max_size=1024, ttl=None, prefix='django_rester'):
+    # backend: None for in-process LRUCache or django cache alias
+    if backend:
+        return DjangoCache(backend, ttl, prefix)
+    return LRUCache(max_size, ttl)
@@ -1,11 +1,18 @@
+import asyncio
 import pycurl
 import logging
+import random
+import time
 import json as json_lib
 import urllib.parse as urllib_parse
-from urllib.parse import urljoin
+from collections import deque
+from concurrent.futures import Future
+from threading import Lock
+from urllib.parse import urljoin, urlsplit
 from io import BytesIO
 
-from django_rester.exceptions import ResterException
+from django_rester.exceptions import ResterException, CircuitOpenError
+from django_rester.stream import JSONArrayParser
 
 logger = logging.getLogger('django_rester.client')
 
@@ -74,6 +81,7 @@ class Curl:
 
     def set_timeout(self, timeout):
         """Set timeout for a retrieving an object"""
+        self.timeout = timeout
         self.set_option(pycurl.TIMEOUT, timeout)
 
     def set_url(self, url):
@@ -89,8 +97,8 @@ class Curl:
         """Set verbosity to 1 to see transactions."""
         self.set_option(pycurl.VERBOSE, level)
 
-    def __request(self, relative_url=None):
-        """Perform the pending request."""
+    def _prepare(self, relative_url=None):
+        """Prepare the pending request to be performed."""
         if self.headers:
             self.set_option(pycurl.HTTPHEADER, self.headers)
         if relative_url:
@@ -99,28 +107,42 @@ class Curl:
         self.payload_io.seek(0)
         self.payload_io.truncate()
         self.hdr = ""
+
+    def _result(self, message=None):
+        """Capture the response of the performed request."""
+        self.payload = self.payload_io.getvalue()
+        return (self.payload,
+                self.handle.getinfo(pycurl.RESPONSE_CODE),
+                self.handle.errstr() if message is None else message)
+
+    def __request(self, relative_url=None):
+        """Perform the pending request."""
+        self._prepare(relative_url)
         try:
             self.handle.perform()
         except ResterException:
             pass
-        self.payload = self.payload_io.getvalue()
-        return (self.payload,
-                self.handle.getinfo(pycurl.RESPONSE_CODE),
-                self.handle.errstr())
+        return self._result()
 
-    def get(self, url="", params=None):
-        """Ship a GET request for a specified URL, capture the response."""
+    def _set_get(self, url="", params=None):
         if params:
             url += "?" + urllib_parse.urlencode(params)
         self.set_option(pycurl.HTTPGET, 1)
-        return self.__request(url)
+        return url
 
-    def post(self, url="", params=None):
-        """Ship a POST request to a specified CGI, capture the response."""
+    def _set_post(self, url="", params=None):
         self.set_option(pycurl.POST, 1)
         if params:
             self.set_option(pycurl.POSTFIELDS, urllib_parse.urlencode(params))
-        return self.__request(url)
+        return url
+
+    def get(self, url="", params=None):
+        """Ship a GET request for a specified URL, capture the response."""
+        return self.__request(self._set_get(url, params))
+
+    def post(self, url="", params=None):
+        """Ship a POST request to a specified CGI, capture the response."""
+        return self.__request(self._set_post(url, params))
 
     def body(self):
         """Return the body from the last response."""
@@ -187,12 +209,104 @@ class Curl:
         self.close()
 
 
+class RetryPolicy:
+    """Retries of failed requests with exponential backoff and jitter.
+
+    Only idempotent methods are retried, on transport errors (connection
+    failure, timeout) and on `statuses` responses. Retry budget limits
+    retries to `budget` share of requests (plus `min_retries` burst), so
+    retries do not multiply the load on an already failing upstream.
+    The same policy (and its budget) could be shared between clients.
+    """
+
+    def __init__(self, retries=3, backoff=0.1, max_backoff=2.0,
+                 methods=('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'),
+                 statuses=(502, 503, 504), budget=0.2, min_retries=10):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.methods = frozenset(methods)
+        self.statuses = frozenset(statuses)
+        self.budget = budget
+        self.min_retries = min_retries
+        self._tokens = float(min_retries)
+        self._lock = Lock()
+
+    def request(self):
+        # every request adds a part of retry to the budget
+        with self._lock:
+            self._tokens = min(self._tokens + self.budget,
+                               max(self.min_retries, 1))
+
+    def should_retry(self, method, response_code, attempt):
+        if (attempt >= self.retries or method not in self.methods
+                or (response_code and response_code not in self.statuses)):
+            return False
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+        return True
+
+    def delay(self, attempt):
+        # "full jitter" backoff
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Per host circuit breaker.
+
+    After `threshold` failures (transport errors or 5xx responses) in
+    a row the circuit opens and requests to the host fail fast with
+    CircuitOpenError for `reset_timeout` seconds, then a single probe
+    request is let through to close the circuit again on success.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._hosts = {}  # host -> [failures, opened_at, probing]
+        self._lock = Lock()
+
+    def allow(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state[1] is None:
+                return True
+            if state[2] or time.monotonic() - state[1] < self.reset_timeout:
+                return False
+            state[2] = True
+            return True
+
+    def record(self, host, success):
+        with self._lock:
+            if success:
+                self._hosts.pop(host, None)
+                return
+            state = self._hosts.setdefault(host, [0, None, False])
+            state[0] += 1
+            if state[0] >= self.threshold or state[2]:
+                if state[1] is None or state[2]:
+                    logger.warning('Circuit is open for %s', host)
+                state[1], state[2] = time.monotonic(), False
+
+    def is_open(self, host):
+        state = self._hosts.get(host)
+        return state is not None and state[1] is not None
+
+
 class ResterClient(Curl):
-    def __init__(self, base_url='', headers=None, opts=None):
+    def __init__(self, base_url='', headers=None, opts=None, retry=None,
+                 breaker=None):
         super().__init__(base_url, headers or [])
+        self.retry = retry
+        self.breaker = breaker
+        self._multi = None
         all_opts = dict(DEFAULT_OPTIONS)
         all_opts.update(opts or {})
         self.set_options(all_opts)
+        self.timeout = all_opts.get('TIMEOUT', self.timeout)
 
     def set_options(self, opts):
         for key, value in opts.items():
@@ -201,15 +315,127 @@ class ResterClient(Curl):
                 self.set_option(opt_key, value)
 
     def get(self, url='', params=None):
-        response, response_code, msg = super().get(url, params)
-        return self._response_decode(response, response_code, msg)
+        return self._send('GET', url, super().get, params)
 
     def post(self, url='', params=None, json=None):
-        if json:
-            body = json_lib.dumps(json)
-            self.set_option(pycurl.POSTFIELDS, body)
-        response, response_code, msg = super().post(url, params)
-        return self._response_decode(response, response_code, msg)
+        self._set_json(json)
+        return self._send('POST', url, super().post, params)
+
+    def _send(self, method, url, perform, params):
+        retry, breaker = self.retry, self.breaker
+        if retry is None and breaker is None:
+            return self._response_decode(*perform(url, params))
+        host = urlsplit(urljoin(self.base_url, url)).netloc
+        if retry is not None:
+            retry.request()
+        attempt = 0
+        while True:
+            if breaker is not None and not breaker.allow(host):
+                raise CircuitOpenError('Circuit is open for {}'.format(host))
+            error, response, msg = None, None, ''
+            try:
+                response, response_code, msg = perform(url, params)
+            except pycurl.error as err:
+                error, response_code = err, 0
+            if breaker is not None:
+                breaker.record(host, 0 < response_code < 500)
+            if retry is None or not retry.should_retry(
+                    method, response_code, attempt):
+                if error is not None:
+                    raise error
+                return self._response_decode(response, response_code, msg)
+            time.sleep(retry.delay(attempt))
+            attempt += 1
+
+    def _set_json(self, json):
+        # handles are reused, so the body is always set: empty one
+        # replaces the previous body (curl reads stdin without it)
+        self.set_option(pycurl.POSTFIELDS,
+                        json_lib.dumps(json) if json else '')
+
+    def _set_request(self, method, url='', params=None, json=None,
+                     timeout=None):
+        """Prepare the request to be performed by CurlMulti."""
+        timeout = self.timeout if timeout is None else timeout
+        self.set_option(pycurl.TIMEOUT_MS, int(timeout * 1000))
+        if method == 'GET':
+            url = self._set_get(url, params)
+        elif method == 'POST':
+            self._set_json(json)
+            url = self._set_post(url, params)
+        else:
+            raise ResterException('{} method is not supported'.format(method))
+        self._prepare(url)
+
+    def stream(self, url='', params=None, json=None, method='GET',
+               items=False, key=None, timeout=None):
+        """Perform the request, yield response body chunks as they come.
+
+        With items=True json array items are yielded instead, parsed
+        incrementally (see JSONArrayParser for `key`), so memory usage
+        does not depend on the response size. Response code is available
+        with get_info(pycurl.RESPONSE_CODE) once the first chunk is read.
+        """
+        chunks = deque()
+        parser = JSONArrayParser(key=key) if items else None
+        # connections are cached by the multi handle, so it is reused
+        multi = self._multi
+        if multi is None:
+            multi = self._multi = pycurl.CurlMulti()
+        self.set_option(pycurl.WRITEFUNCTION, chunks.append)
+        try:
+            self._set_request(method, url, params, json, timeout)
+            multi.add_handle(self.handle)
+            while True:
+                while True:
+                    ret, num_handles = multi.perform()
+                    if ret != pycurl.E_CALL_MULTI_PERFORM:
+                        break
+                while chunks:
+                    if parser is None:
+                        yield chunks.popleft()
+                    else:
+                        yield from parser.feed(chunks.popleft())
+                if not num_handles:
+                    break
+                wait = multi.timeout()
+                multi.select(1.0 if wait < 0 else min(1.0, wait / 1000))
+            num_queued, ok_list, err_list = multi.info_read()
+            if err_list:
+                raise pycurl.error(*err_list[0][1:])
+            if parser is not None:
+                yield from parser.close()
+        finally:
+            multi.remove_handle(self.handle)
+            self._restore_options()
+
+    def download(self, url, target, params=None, json=None, method='GET',
+                 timeout=None):
+        """Write response body to a file (path or object with write()).
+
+        Result has no data, the body is never kept in memory.
+        """
+        file = open(target, 'wb') if isinstance(target, str) else target
+        self.set_option(pycurl.WRITEFUNCTION, file.write)
+        try:
+            self._set_request(method, url, params, json, timeout)
+            self.handle.perform()
+            return self._response_decode(
+                None, self.handle.getinfo(pycurl.RESPONSE_CODE), '')
+        finally:
+            self._restore_options()
+            if file is not target:
+                file.close()
+
+    def close(self):
+        super().close()
+        if getattr(self, '_multi', None) is not None:
+            self._multi.close()
+            self._multi = None
+
+    def _restore_options(self):
+        self.set_option(pycurl.WRITEFUNCTION, self.payload_io.write)
+        self.set_option(pycurl.TIMEOUT_MS, int(self.timeout * 1000))
 
     @staticmethod
     def _response_decode(response, response_code=200, message=''):
@@ -217,9 +443,8 @@ class ResterClient(Curl):
         data = None
         if response:
             try:
-                data = json_lib.loads(isinstance(response, bytes)
-                                      and response.decode('utf-8')
-                                      or response)
+                # json parses utf-8 bytes itself, no decoded copy is made
+                data = json_lib.loads(response)
                 resp_type = 'json'
             except json_lib.decoder.JSONDecodeError:
                 data = response
@@ -229,3 +454,241 @@ class ResterClient(Curl):
                 'message': message and [message] or [],
                 'response_code': response_code,
                 'data': data}
+
+
+class _MultiClient:
+    # handles pool and CurlMulti/CurlShare setup, shared by ResterPool and
+    # AsyncResterClient, subclasses define submit() and request_many()
+
+    def __init__(self, base_url='', headers=None, opts=None,
+                 max_connections=10):
+        self.base_url = base_url
+        self.headers = headers
+        self.opts = opts
+        self.max_connections = max_connections
+        self.share = pycurl.CurlShare()
+        for lock in ('LOCK_DATA_DNS', 'LOCK_DATA_SSL_SESSION',
+                     'LOCK_DATA_CONNECT'):
+            try:
+                self.share.setopt(pycurl.SH_SHARE, getattr(pycurl, lock))
+            except (AttributeError, pycurl.error):
+                # not available in older libcurl versions
+                pass
+        self.multi = pycurl.CurlMulti()
+        self.multi.setopt(pycurl.M_MAX_TOTAL_CONNECTIONS, max_connections)
+        self._clients = []  # all clients created by the pool
+        self._free = []  # idle clients
+        self._queue = deque()  # requests waiting for a free client
+        self._active = {}  # handle -> (client, future)
+
+    def get(self, url='', params=None, timeout=None):
+        return self.submit('GET', url, params, timeout=timeout)
+
+    def post(self, url='', params=None, json=None, timeout=None):
+        return self.submit('POST', url, params, json, timeout)
+
+    def get_many(self, urls, params=None):
+        return self.request_many([('GET', url, params) for url in urls])
+
+    def post_many(self, urls_json):
+        return self.request_many([('POST', url, None, json)
+                                  for url, json in urls_json])
+
+    def _start_future(self, future):
+        return future.set_running_or_notify_cancel()
+
+    def _start_queued(self):
+        while self._queue and (self._free or len(
+                self._clients) < self.max_connections):
+            method, url, params, json, timeout, future = self._queue.popleft()
+            if not self._start_future(future):
+                continue
+            client = self._get_client()
+            try:
+                client._set_request(method, url, params, json, timeout)
+            except Exception as err:
+                self._free.append(client)
+                future.set_exception(err)
+                continue
+            self._active[client.handle] = (client, future)
+            self.multi.add_handle(client.handle)
+
+    def _get_client(self):
+        if self._free:
+            return self._free.pop()
+        client = ResterClient(self.base_url, list(self.headers or []),
+                              self.opts)
+        client.set_option(pycurl.SHARE, self.share)
+        self._clients.append(client)
+        return client
+
+    def _read_info(self):
+        while True:
+            num_queued, ok_list, err_list = self.multi.info_read()
+            for handle in ok_list:
+                self._finish(handle)
+            for handle, errno, errmsg in err_list:
+                self._finish(handle, errmsg)
+            if not num_queued:
+                break
+        self._start_queued()
+
+    def _finish(self, handle, message=None):
+        client, future = self._active.pop(handle)
+        self.multi.remove_handle(handle)
+        response, response_code, msg = client._result(message or '')
+        self._free.append(client)
+        if not future.done():
+            future.set_result(
+                client._response_decode(response, response_code, msg))
+
+    def close(self):
+        """Close all handles, freeing resources."""
+        for handle in list(self._active):
+            self.multi.remove_handle(handle)
+        self._active.clear()
+        for client in self._clients:
+            client.close()
+        self._clients, self._free = [], []
+        self.multi.close()
+        self.share.close()
+
+
+class ResterPool(_MultiClient):
+    """Runs many requests concurrently from one thread with CurlMulti.
+
+    Handles (and their keep-alive connections) are reused between
+    requests, DNS cache, TLS sessions and connections are shared with
+    CurlShare. Every request result is a ResterClient._response_decode()
+    dict, transfer errors are reported with response_code 0 and curl
+    error message. The pool itself is not thread-safe, use one per thread.
+    """
+
+    def submit(self, method, url='', params=None, json=None, timeout=None):
+        """Queue the request, returns Future resolved by perform()."""
+        future = Future()
+        self._queue.append((method, url, params, json, timeout, future))
+        return future
+
+    def request_many(self, requests):
+        """Perform (method, url, params, json) requests, return results."""
+        futures = [self.submit(*request) for request in requests]
+        self.perform()
+        return [future.result() for future in futures]
+
+    def perform(self, timeout=1.0):
+        """Perform all queued requests."""
+        self._start_queued()
+        while self._active:
+            while True:
+                ret, num_handles = self.multi.perform()
+                if ret != pycurl.E_CALL_MULTI_PERFORM:
+                    break
+            self._read_info()
+            if self._active:
+                # libcurl timers (request timeouts) may expire earlier
+                wait = self.multi.timeout()
+                self.multi.select(
+                    timeout if wait < 0 else min(timeout, wait / 1000))
+
+
+class AsyncResterClient(_MultiClient):
+    """Non-blocking client driven by the asyncio event loop.
+
+    CurlMulti sockets are watched with loop.add_reader/add_writer, so
+    requests do not occupy threads. At most max_connections requests are
+    performed at once, others wait in the queue, idle connections are
+    kept alive for the next requests. get/post/get_many/post_many return
+    awaitables with ResterClient-like results. A client is bound to the
+    event loop it is first used in.
+    """
+
+    def __init__(self, base_url='', headers=None, opts=None,
+                 max_connections=10):
+        super().__init__(base_url, headers, opts, max_connections)
+        self._loop = None
+        self._timer = None
+        self._fds = set()
+        self.multi.setopt(pycurl.M_SOCKETFUNCTION, self._on_socket)
+        self.multi.setopt(pycurl.M_TIMERFUNCTION, self._on_timer)
+
+    def submit(self, method, url='', params=None, json=None, timeout=None):
+        """Start the request, returns asyncio future with the result."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        future = self._loop.create_future()
+        future.add_done_callback(self._discard)
+        self._queue.append((method, url, params, json, timeout, future))
+        self._start_queued()
+        return future
+
+    async def request_many(self, requests):
+        """Perform (method, url, params, json) requests, return results."""
+        return await asyncio.gather(*[self.submit(*request)
+                                      for request in requests])
+
+    def _start_future(self, future):
+        return not future.cancelled()
+
+    def _discard(self, future):
+        # stops the transfer of a cancelled request
+        if not future.cancelled():
+            return
+        for handle, (client, active) in list(self._active.items()):
+            if active is future:
+                del self._active[handle]
+                self.multi.remove_handle(handle)
+                self._free.append(client)
+                self._start_queued()
+                break
+
+    def _on_socket(self, event, fd, multi, data):
+        loop = self._loop
+        if event == pycurl.POLL_REMOVE:
+            loop.remove_reader(fd)
+            loop.remove_writer(fd)
+            self._fds.discard(fd)
+            return
+        self._fds.add(fd)
+        if event in (pycurl.POLL_IN, pycurl.POLL_INOUT):
+            loop.add_reader(fd, self._socket_action, fd, pycurl.CSELECT_IN)
+        else:
+            loop.remove_reader(fd)
+        if event in (pycurl.POLL_OUT, pycurl.POLL_INOUT):
+            loop.add_writer(fd, self._socket_action, fd, pycurl.CSELECT_OUT)
+        else:
+            loop.remove_writer(fd)
+
+    def _on_timer(self, timeout_ms):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if timeout_ms >= 0:
+            self._timer = self._loop.call_later(
+                timeout_ms / 1000, self._socket_action,
+                pycurl.SOCKET_TIMEOUT, 0)
+
+    def _socket_action(self, fd, event):
+        if fd == pycurl.SOCKET_TIMEOUT:
+            self._timer = None
+        self.multi.socket_action(fd, event)
+        self._read_info()
+
+    def close(self):
+        """Close all handles, freeing resources."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for fd in self._fds:
+            self._loop.remove_reader(fd)
+            self._loop.remove_writer(fd)
+        self._fds.clear()
+        for client, future in self._active.values():
+            future.cancel()
+        super().close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
@@ -0,0 +1,89 @@
+import json
+import logging
+
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger('django_rester')
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JSONCodec:
+    # stdlib json adapter, every codec should provide the same interface:
+    # dumps(data) -> bytes, raises TypeError or ValueError
+    # loads(bytes or str) -> data, raises ValueError
+    name = 'json'
+
+    @staticmethod
+    def dumps(data):
+        return json.dumps(data).encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    name = 'ujson'
+
+    @staticmethod
+    def dumps(data):
+        return ujson.dumps(data).encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        return ujson.loads(data)
+
+
+CODECS = {
+    'json': (JSONCodec, json),
+    'orjson': (OrjsonCodec, orjson),
+    'ujson': (UjsonCodec, ujson),
+}
+
+
+def get_codec(backend):
+    # backend could be a name from CODECS, a codec class or
+    # a 'package.module.CodecClass' string
+    if backend in CODECS:
+        codec, module = CODECS[backend]
+        if module is None:
+            logger.warning('JSON_BACKEND `{}` is not installed, stdlib json '
+                           'is used'.format(backend))
+            codec = JSONCodec
+    elif isinstance(backend, str):
+        try:
+            module_name, class_name = backend.rsplit('.', 1)
+            tmp = __import__(module_name, globals(), locals(), [class_name])
+            codec = getattr(tmp, class_name)
+        except (ValueError, ImportError, AttributeError) as exc:
+            raise ImproperlyConfigured(
+                'JSON_BACKEND `{}` could not be imported: {}'.format(
+                    backend, exc))
+    elif isinstance(backend, type):
+        codec = backend
+    else:
+        raise ImproperlyConfigured(
+            'JSON_BACKEND should be a codec name, class or import path, '
+            'got {!r}'.format(backend))
+    return codec()
@@ -1,23 +1,89 @@
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+
+from .cache import ResponseCache, get_cache
 from .permission import BasePermission
 from .status import HTTP_401_UNAUTHORIZED
 
 
 def permissions(*perms):
+    # permission classes are resolved once, results are cached on request
+    perms = tuple(perm_item for perm_item in perms
+                  if issubclass(perm_item, BasePermission))
+
+    def check_permissions(request):
+        checked, message = True, ''
+        for perm_item in perms:
+            checked, message = perm_item.evaluate(request)
+            if not checked:
+                break
+        return checked, message
+
     def permissions_decorator(f):
-        def wrapper(view, request, *args, **kwargs):
-            checked, message = True, ''
-            for perm_item in perms:
-                if issubclass(perm_item, BasePermission):
-                    auth_check = perm_item(request)
-                    checked, message = auth_check.check, auth_check.message
-                    if not checked:
-                        break
-            if checked:
-                data = f(view, request, *args, **kwargs)
-            else:
-                data = message, HTTP_401_UNAUTHORIZED
-            return data
+        if iscoroutinefunction(f):
+            async def wrapper(view, request, *args, **kwargs):
+                # request.user could be lazy and hit the database
+                checked, message = await sync_to_async(check_permissions)(
+                    request)
+                if checked:
+                    data = await f(view, request, *args, **kwargs)
+                else:
+                    data = message, HTTP_401_UNAUTHORIZED
+                return data
+        else:
+            def wrapper(view, request, *args, **kwargs):
+                checked, message = check_permissions(request)
+                if checked:
+                    data = f(view, request, *args, **kwargs)
+                else:
+                    data = message, HTTP_401_UNAUTHORIZED
+                return data
 
+        # checked by views before request parsing with auth_before_parse
+        wrapper.permissions = perms + getattr(f, 'permissions', ())
         return wrapper
 
     return permissions_decorator
+
+
+def cached_response(ttl=60, vary_on=(), backend=None, max_size=1024,
+                    lock_timeout=10):
+    # caches serialized handler responses for ttl seconds: in process
+    # (LRU, max_size items) or in django cache with backend alias
+    response_cache = ResponseCache(
+        get_cache(backend, max_size, ttl, 'django_rester:response'),
+        vary_on, lock_timeout)
+
+    def cached_response_decorator(f):
+        if iscoroutinefunction(f):
+            async def wrapper(view, request, *args, **kwargs):
+                key = response_cache.make_key(request, view.request_data)
+                response = await response_cache.aget(key)
+                if response is None:
+                    event = await response_cache.aacquire(key)
+                    if event is None:
+                        response = await response_cache.aget(key)
+                if response is not None:
+                    return view._set_cors(response)
+                # the view stores the response after its serialization
+                view._cached = (response_cache, key, event)
+                return await f(view, request, *args, **kwargs)
+        else:
+            def wrapper(view, request, *args, **kwargs):
+                key = response_cache.make_key(request, view.request_data)
+                response = response_cache.get(key)
+                if response is None:
+                    event = response_cache.acquire(key)
+                    if event is None:
+                        response = response_cache.get(key)
+                if response is not None:
+                    return view._set_cors(response)
+                view._cached = (response_cache, key, event)
+                return f(view, request, *args, **kwargs)
+
+        wrapper.response_cache = response_cache
+        wrapper.permissions = getattr(f, 'permissions', ())
+        return wrapper
+
+    return cached_response_decorator
@@ -106,3 +106,8 @@ class ResponseStructureException(MsgListException):
 class CustomValidationException(MsgListException):
     # raise if there error in custom validation
     pass
+
+
+class CircuitOpenError(ResterException):
+    # ResterClient fails fast, upstream host is considered unhealthy
+    pass
@@ -6,12 +6,16 @@ from .exceptions import (
     JSONFieldValueError
 )
 
+# shared result for successful validation, messages lists are only
+# allocated when there is something to report
+NO_MESSAGES = ()
+
 
 class JSONField:
     types = (int, float, str, bool)
 
     def __init__(self, field_type=None, required=False, default=None,
-                 blank=True, model=None, field=''):
+                 blank=True, model=None, field='', attach=False):
         if field_type not in self.types:
             raise JSONFieldValueError('field_type should be one of: {}'.format(
                 str(self.types).replace("<class '", '').replace("'>", '')))
@@ -19,9 +23,10 @@ class JSONField:
         self.required = required or (not blank)
         self.default = default
         self.blank = blank
-        self.key = ''
         self.model = self._set_model(model)
         self.field = field
+        # replace validated value with the model instance
+        self.attach = attach
 
         if model and not field:
             self.field = 'id'
@@ -29,32 +34,24 @@ class JSONField:
             # if not self.var_type:
             #    raise ValueError('var_type should be specified')
 
-    def check_type(self, value):
-        messages = []
+    def check_type(self, value, key=''):
         try:
-            _value = self.field_type(value)
+            return self.field_type(value), NO_MESSAGES
         except (TypeError, ValueError):
-            messages.append('Could not treat {} value `{}` as {}'.format(
-                self.key or '', value, self.field_type))
-            _value = None
-        return _value, messages
+            return None, ['Could not treat {} value `{}` as {}'.format(
+                key, value, self.field_type)]
 
     def validate(self, key, value):
-        self.key = key
-        messages = []
-        if self.required and (value is None):
-            messages.append('`{}` value is required'.format(key))
-        else:
-            if not self.blank and value == '':
-                messages.append('`{}` value blank is not allowed'.format(key))
-            elif (self.default is not None) and (value is None):
+        # field instances are shared between requests (and threads),
+        # so nothing request related should be stored on self here
+        if value is None:
+            if self.required:
+                return None, ['`{}` value is required'.format(key)]
+            if self.default is not None:
                 value = self.default
-        if messages:
-            value = None
-        else:
-            value, msg = self.check_type(value)
-            messages += msg
-        return value, messages
+        elif not self.blank and value == '':
+            return None, ['`{}` value blank is not allowed'.format(key)]
+        return self.check_type(value, key)
 
     @staticmethod
     def _set_model(model):
@@ -79,30 +76,34 @@ class JSONField:
 class String(JSONField):
     def __init__(self,
                  required=False, default=None,
-                 blank=True, model=None, field=''):
+                 blank=True, model=None, field='', attach=False):
         super().__init__(field_type=str, required=required, default=default,
-                         blank=blank, model=model, field=field)
+                         blank=blank, model=model, field=field,
+                         attach=attach)
 
 
 class Int(JSONField):
     def __init__(self,
                  required=False, default=None,
-                 blank=True, model=None, field=''):
+                 blank=True, model=None, field='', attach=False):
         super().__init__(field_type=int, required=required, default=default,
-                         blank=blank, model=model, field=field)
+                         blank=blank, model=model, field=field,
+                         attach=attach)
 
 
 class Float(JSONField):
     def __init__(self,
                  required=False, default=None,
-                 blank=True, model=None, field=''):
+                 blank=True, model=None, field='', attach=False):
         super().__init__(field_type=float, required=required, default=default,
-                         blank=blank, model=model, field=field)
+                         blank=blank, model=model, field=field,
+                         attach=attach)
 
 
 class Bool(JSONField):
     def __init__(self,
                  required=False, default=None,
-                 blank=True, model=None, field=''):
+                 blank=True, model=None, field='', attach=False):
         super().__init__(field_type=bool, required=required, default=default,
-                         blank=blank, model=model, field=field)
+                         blank=blank, model=model, field=field,
+                         attach=attach)
@@ -0,0 +1,123 @@
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+
+from django.dispatch import Signal
+from django.http import HttpResponse
+from django.http.response import HttpResponseBase
+
+from .settings import rester_settings
+
+PHASES = ('parse', 'auth', 'request_validation', 'handler',
+          'response_validation', 'serialization')
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+
+# sent after every instrumented request with sender=view class and
+# request, response, timing arguments
+request_timed = Signal()
+
+
+class Timing:
+    """Per-request phases timer.
+
+    mark(phase) adds the time passed since the previous mark (or the
+    request start) to the phase, durations are in seconds.
+    """
+    __slots__ = ('start', 'last', 'phases')
+
+    def __init__(self):
+        self.start = self.last = perf_counter()
+        self.phases = {}
+
+    def mark(self, phase):
+        now = perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self.last
+        self.last = now
+
+    @property
+    def total(self):
+        return self.last - self.start
+
+    def server_timing(self):
+        # Server-Timing header value, durations are in milliseconds
+        return ', '.join('{};dur={:.3f}'.format(phase, duration * 1000)
+                         for phase, duration in self.phases.items()
+                         ) + ', total;dur={:.3f}'.format(self.total * 1000)
+
+
+class HistogramCollector:
+    """In-process Prometheus-style histograms of phase durations.
+
+    Histograms are labeled with view, method and phase, render() returns
+    them in Prometheus text exposition format.
+    """
+    name = 'django_rester_request_phase_seconds'
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms = {}  # labels -> [bucket counts, sum, count]
+        self._lock = Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            histogram = self._histograms.get(labels)
+            if histogram is None:
+                histogram = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._histograms[labels] = histogram
+            histogram[0][bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def collect(self, view, method, timing):
+        for phase, duration in timing.phases.items():
+            self.observe((view, method, phase), duration)
+        self.observe((view, method, 'total'), timing.total)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        lines = ['# HELP {} Time spent in request processing phases'.format(
+            self.name), '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            histograms = [(labels, list(counts), total, count)
+                          for labels, (counts, total, count)
+                          in sorted(self._histograms.items())]
+        for (view, method, phase), counts, total, count in histograms:
+            labels = 'view="{}",method="{}",phase="{}"'.format(
+                view, method, phase)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    self.name, labels, bound, cumulative))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(
+                self.name, labels, count))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, labels, total))
+            lines.append('{}_count{{{}}} {}'.format(self.name, labels, count))
+        return '\n'.join(lines) + '\n'
+
+
+collector = HistogramCollector()
+
+
+def start_timing():
+    # None if instrumentation is disabled, views skip all the timing then
+    return Timing() if rester_settings.get('INSTRUMENTATION') else None
+
+
+def finish_timing(view, request, response, timing):
+    if rester_settings.get('SERVER_TIMING') and isinstance(
+            response, HttpResponseBase):
+        response['Server-Timing'] = timing.server_timing()
+    collector.collect(type(view).__name__, request.method, timing)
+    request_timed.send(sender=type(view), request=request,
+                       response=response, timing=timing)
+
+
+def metrics_view(request):
+    # exposes in-process histograms for Prometheus scraping
+    return HttpResponse(collector.render(),
+                        content_type='text/plain; version=0.0.4')
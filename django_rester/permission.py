@@ -1,4 +1,15 @@
-class BasePermission:
+class PermissionMeta(type):
+    """Permission classes could be composed: IsAdmin | IsOwner,
+    IsAuthenticated & IsStaff (the result is a permission class too)."""
+
+    def __and__(cls, other):
+        return _compose(cls, other, any_of=False)
+
+    def __or__(cls, other):
+        return _compose(cls, other, any_of=True)
+
+
+class BasePermission(metaclass=PermissionMeta):
     def __init__(self, request):
         self.check, self.message = False, ''
         self.request = request
@@ -7,43 +18,95 @@ class BasePermission:
     def _get_message(check, messages):
         return messages.get('SUCCESS' if check else 'FAIL', None)
 
+    @classmethod
+    def has_permission(cls, request):
+        # stateless (check, message) of the request, subclasses could
+        # override it instead of computing check and message in __init__
+        permission = cls(request)
+        return permission.check, permission.message
+
+    @classmethod
+    def evaluate(cls, request):
+        # has_permission() result cached on the request, so stacked
+        # decorators and composed permissions check it once
+        cache = request.__dict__.setdefault('_rester_permissions', {})
+        result = cache.get(cls)
+        if result is None:
+            result = cache[cls] = cls.has_permission(request)
+        return result
+
+
+class ComposedPermission(BasePermission):
+    # all (or any, if any_of) of permissions should be passed
+    permissions = ()
+    any_of = False
 
-class IsAuthenticated(BasePermission):
     def __init__(self, request):
         super().__init__(request)
-        self.check, self.message = self._is_authenticated()
-
-    def _is_authenticated(self):
-        check = (self.request.user.is_authenticated
-                 and not self.request.user.is_anonymous
-                 and self.request.user.is_active)
-        messages = {'SUCCESS': ['Auth OK'],
-                    'FAIL': ['Required credentials are not provided']}
-        message = self._get_message(check, messages)
+        self.check, self.message = self.has_permission(request)
+
+    @classmethod
+    def has_permission(cls, request):
+        check, message = True, ''
+        for permission in cls.permissions:
+            check, message = permission.evaluate(request)
+            if bool(check) == cls.any_of:
+                break
         return check, message
 
 
+def _compose(first, second, any_of):
+    permissions = []
+    for permission in (first, second):
+        if (issubclass(permission, ComposedPermission)
+                and permission.any_of == any_of):
+            permissions.extend(permission.permissions)
+        else:
+            permissions.append(permission)
+    name = '({})'.format((' | ' if any_of else ' & ').join(
+        permission.__name__ for permission in permissions))
+    return PermissionMeta(name, (ComposedPermission,), {
+        'permissions': tuple(permissions), 'any_of': any_of})
+
+
+class IsAuthenticated(BasePermission):
+    messages = {'SUCCESS': ['Auth OK'],
+                'FAIL': ['Required credentials are not provided']}
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.check, self.message = self.has_permission(request)
+
+    @classmethod
+    def has_permission(cls, request):
+        check = (request.user.is_authenticated
+                 and not request.user.is_anonymous
+                 and request.user.is_active)
+        return check, cls._get_message(check, cls.messages)
+
+
 class IsAdmin(BasePermission):
+    messages = {'SUCCESS': ['Auth OK'],
+                'FAIL': ['Required credentials are not provided '
+                         'or user is not superuser']}
+
     def __init__(self, request):
         super().__init__(request)
-        self.check, self.message = self._is_admin()
-
-    def _is_admin(self):
-        check = self.request.user.is_superuser and self.request.user.is_active
-        messages = {'SUCCESS': ['Auth OK'],
-                    'FAIL': ['Required credentials are not provided '
-                             'or user is not superuser']}
-        message = self._get_message(check, messages)
-        return check, message
+        self.check, self.message = self.has_permission(request)
+
+    @classmethod
+    def has_permission(cls, request):
+        check = request.user.is_superuser and request.user.is_active
+        return check, cls._get_message(check, cls.messages)
 
 
 class AllowAny(BasePermission):
+    messages = {'SUCCESS': ['Auth OK']}
+
     def __init__(self, request):
         super().__init__(request)
-        self.check, self.message = self._allow_any()
+        self.check, self.message = self.has_permission(request)
 
-    def _allow_any(self):
-        check = True
-        messages = {'SUCCESS': ['Auth OK']}
-        message = self._get_message(check, messages)
-        return check, message
+    @classmethod
+    def has_permission(cls, request):
+        return True, cls._get_message(True, cls.messages)
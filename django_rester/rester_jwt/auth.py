@@ -1,9 +1,14 @@
+import copy
 import datetime
+import hashlib
 import jwt
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
 from django_rediser import RedisStorage
+from ..cache import LRUCache, get_cache
 from ..status import HTTP_200_OK
+from .revocation import TokenDenylist
 from .settings import rester_jwt_settings
 from django_rester.exceptions import ResponseAuthError
 
@@ -15,9 +20,40 @@ if (
     redis_db = rester_jwt_settings['USE_REDIS']
 
 
+redis_storage = RedisStorage(db=redis_db)
+
+denylist = None
+if (
+        rester_jwt_settings['USE_REDIS']
+        and rester_jwt_settings['REVOCATION'] == 'denylist'
+):
+    denylist = TokenDenylist(redis_storage,
+                             rester_jwt_settings['REVOCATION_SYNC'],
+                             rester_jwt_settings['EXPIRE'])
+
+token_cache = None
+if rester_jwt_settings['TOKEN_CACHE_SIZE']:
+    token_cache = LRUCache(rester_jwt_settings['TOKEN_CACHE_SIZE'])
+
+user_cache = None
+if (
+        rester_jwt_settings['USER_CACHE_SIZE']
+        or rester_jwt_settings['USER_CACHE_BACKEND']
+):
+    user_cache = get_cache(rester_jwt_settings['USER_CACHE_BACKEND'],
+                           rester_jwt_settings['USER_CACHE_SIZE'],
+                           rester_jwt_settings['USER_CACHE_TTL'],
+                           'django_rester:user')
+
+
 class BaseAuth:
     _key = '_token'
-    _rs = RedisStorage(db=redis_db)
+    _rs = redis_storage
+    _denylist = denylist
+    # verified token digests -> decoded claims, expires with the token
+    _token_cache = token_cache
+    # authenticated users by token claims, expires with the token
+    _user_cache = user_cache
     settings = rester_jwt_settings
 
     @classmethod
@@ -40,6 +76,20 @@ class BaseAuth:
     def _is_member(self, token):
         return self._rs.sismember(self._key, token)
 
+    def _is_active(self, token):
+        # token is not revoked: in redis allowlist or not in local denylist
+        if self._denylist is not None:
+            return not self._denylist.is_revoked(self._token_digest(token))
+        return self._is_member(token)
+
+    def _revoke_token(self, token):
+        if self._denylist is None:
+            return self._rem_token(token)
+        user_data, exp_date, messages = self._get_token_data(token)
+        if not user_data:
+            return 0
+        return self._denylist.revoke(self._token_digest(token), exp_date)
+
     @classmethod
     def _get_token(cls, request):
         token, messages = None, []
@@ -58,35 +108,163 @@ class BaseAuth:
         user = user_model.objects.get(**kwargs)
         return user
 
+    @staticmethod
+    async def _aget_user(**kwargs):
+        user_model = get_user_model()
+        user = await user_model.objects.aget(**kwargs)
+        return user
+
     def _get_user_data(self, token):
-        is_member, data, exp_date = True, None, None
-        user_data, user, messages = {}, None, []
+        user, messages = None, []
+        is_member = True
         if self.settings['USE_REDIS']:
-            is_member = self._is_member(token)
+            is_member = self._is_active(token)
         if is_member:
-            try:
-                data = jwt.decode(token, self.settings['SECRET'],
-                                  algorithms=[self.settings['ALGORITHM']])
-            except jwt.DecodeError:
-                messages.append('Wrong authentication token')
-            except jwt.ExpiredSignatureError:
-                messages.append('Authentication token expired')
-
-            if data:
-                exp_date = data.pop('exp', None)
-                user_data = {item: data.get(item, None) for item in
-                             self.settings['PAYLOAD_LIST']}
-            if (
-                    exp_date
-                    and user_data
-                    and exp_date > datetime.datetime.now().timestamp()
-            ):
-                user = self._get_user(**user_data)
+            user_data, exp_date, messages = self._get_token_data(token)
+            if user_data:
+                user = self._get_cached_user(user_data, exp_date)
         else:
             messages.append('Authentication token is not valid or expired')
+        return user, messages
 
+    async def _aget_user_data(self, token):
+        user, messages = None, []
+        is_member = True
+        if self.settings['USE_REDIS']:
+            if self._denylist is not None:
+                is_member = self._is_active(token)
+            else:
+                is_member = await sync_to_async(self._is_member)(token)
+        if is_member:
+            user_data, exp_date, messages = self._get_token_data(token)
+            if user_data:
+                user = await self._aget_cached_user(user_data, exp_date)
+        else:
+            messages.append('Authentication token is not valid or expired')
         return user, messages
 
+    @staticmethod
+    def _token_digest(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    @classmethod
+    def _verified_token(cls, request):
+        # (digest, user lookup data) of the request token if its signature
+        # was already verified (token cache), so throttling could key on it
+        # before authentication
+        if cls._token_cache is None:
+            return None, None
+        token, messages = cls._get_token(request)
+        if not token or messages:
+            return None, None
+        digest = cls._token_digest(token)
+        cached = cls._token_cache.peek(digest)
+        return (digest, cached[0]) if cached is not None else (None, None)
+
+    @classmethod
+    def verified_token_key(cls, request):
+        digest, user_data = cls._verified_token(request)
+        return digest.hex() if digest is not None else None
+
+    @classmethod
+    def verified_user_key(cls, request):
+        # PAYLOAD_LIST claims of the verified token, the same for all
+        # tokens of the user
+        digest, user_data = cls._verified_token(request)
+        if digest is None:
+            return None
+        return 'user:{!r}'.format(cls._user_cache_key(user_data))
+
+    def _get_token_data(self, token):
+        # signature is verified once per token, cache hits only check exp
+        if self._token_cache is None:
+            return self._decode_token(token)
+        key = self._token_digest(token)
+        cached = self._token_cache.get(key)
+        if cached is not None:
+            user_data, exp_date = cached
+            if exp_date > datetime.datetime.now().timestamp():
+                return user_data, exp_date, []
+            return {}, exp_date, ['Authentication token expired']
+        user_data, exp_date, messages = self._decode_token(token)
+        if user_data:
+            self._token_cache.set(key, (user_data, exp_date),
+                                  expires=exp_date)
+        return user_data, exp_date, messages
+
+    def _decode_token(self, token):
+        # returns user lookup data and expiration date for not expired token
+        data, exp_date, user_data, messages = None, None, {}, []
+        try:
+            data = jwt.decode(token, self.settings['SECRET'],
+                              algorithms=[self.settings['ALGORITHM']])
+        except jwt.DecodeError:
+            messages.append('Wrong authentication token')
+        except jwt.ExpiredSignatureError:
+            messages.append('Authentication token expired')
+
+        if data:
+            exp_date = data.pop('exp', None)
+            user_data = {item: data.get(item, None) for item in
+                         self.settings['PAYLOAD_LIST']}
+        if not (
+                exp_date
+                and user_data
+                and exp_date > datetime.datetime.now().timestamp()
+        ):
+            user_data = {}
+        return user_data, exp_date, messages
+
+    @classmethod
+    def _user_cache_key(cls, user_data):
+        return tuple(user_data.get(item, None)
+                     for item in cls.settings['PAYLOAD_LIST'])
+
+    def _get_cached_user(self, user_data, exp_date):
+        if self._user_cache is None:
+            return self._get_user(**user_data)
+        key = self._user_cache_key(user_data)
+        user = self._user_cache.get(key)
+        if user is None:
+            user = self._get_user(**user_data)
+            self._user_cache.set(key, user, expires=exp_date)
+        # in-process cache shares the instance between requests
+        return copy.copy(user)
+
+    async def _aget_cached_user(self, user_data, exp_date):
+        if self._user_cache is None:
+            return await self._aget_user(**user_data)
+        key = self._user_cache_key(user_data)
+        user = await self._user_cache.aget(key)
+        if user is None:
+            user = await self._aget_user(**user_data)
+            await self._user_cache.aset(key, user, expires=exp_date)
+        return copy.copy(user)
+
+    def _invalidate_token(self, token):
+        # drops everything cached for the token
+        if self._user_cache is not None:
+            user_data, exp_date, messages = self._get_token_data(token)
+            if user_data:
+                self._user_cache.delete(self._user_cache_key(user_data))
+        if self._token_cache is not None:
+            self._token_cache.delete(self._token_digest(token))
+
+    @classmethod
+    def token_cache_stats(cls):
+        # hits/misses/size counters of verified tokens cache
+        if cls._token_cache is None:
+            return {'hits': 0, 'misses': 0, 'size': 0}
+        return cls._token_cache.stats()
+
+    @classmethod
+    def invalidate_user(cls, user):
+        # should be called when user is changed (deactivated, etc.)
+        if cls._user_cache is not None:
+            cls._user_cache.delete(cls._user_cache_key(
+                {item: getattr(user, item, None)
+                 for item in cls.settings['PAYLOAD_LIST']}))
+
 
 class Auth(BaseAuth):
     def login(self, request, request_data):
@@ -105,7 +283,12 @@ class Auth(BaseAuth):
             encoded = {'token': token}
         else:
             raise ResponseAuthError('Authentication failed')
-        if status == HTTP_200_OK and self.settings['USE_REDIS'] and token:
+        if (
+                status == HTTP_200_OK
+                and self.settings['USE_REDIS']
+                and self._denylist is None
+                and token
+        ):
             self._push_token(token)
         return encoded, status
 
@@ -113,7 +296,9 @@ class Auth(BaseAuth):
         token, messages = self._get_token(request)
         result = None
         if self.settings['USE_REDIS']:
-            result = self._rem_token(token)
+            result = self._revoke_token(token)
+        if token:
+            self._invalidate_token(token)
         if result == 0:
             messages.append('Token not found')
         elif not result:
@@ -132,5 +317,14 @@ class Auth(BaseAuth):
             user = None
         return user, messages
 
+    async def aauthenticate(self, request_data):
+        user, messages = None, None
+        token, messages = self._get_token(request_data)
+        if token:
+            user, messages = await self._aget_user_data(token)
+        if messages:
+            user = None
+        return user, messages
+
     def register(self, request_data):
         pass
@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+from threading import Lock, Thread
+
+logger = logging.getLogger('django_rester.rester_jwt')
+
+
+class TokenDenylist:
+    """Revoked tokens list, checked locally without network I/O.
+
+    Every revoked token digest (with the token expiration time) is added
+    to a changes log in redis (sorted set, scored by redis server time, so
+    clocks of the hosts do not matter). Each process keeps a local copy of
+    revoked digests and fetches the log delta from redis in a background
+    thread every `interval` seconds, so a token revoked in another process
+    is rejected after `interval` seconds at most. Log entries older than
+    `max_age` (max token lifetime) are pruned.
+    """
+    log_key = '_revoked_log'
+    # log entries of the last seconds are fetched again on every sync, for
+    # revocations written while the previous sync was running
+    overlap = 5
+
+    def __init__(self, storage, interval=5, max_age=60 * 60 * 24 * 14):
+        self.storage = storage
+        self.interval = interval
+        self.max_age = max_age
+        self._revoked = {}  # digest -> token expiration timestamp
+        self._synced_at = None
+        self._lock = Lock()
+        self._pid = None
+
+    def revoke(self, digest, exp):
+        member = '{}:{}'.format(digest.hex(), exp)
+        self.storage.execute('zadd', self.log_key,
+                             {member: self._server_time()})
+        with self._lock:
+            self._revoked[digest] = exp
+        return 1
+
+    def is_revoked(self, digest):
+        if self._pid != os.getpid():
+            self._start()
+        exp = self._revoked.get(digest)
+        return exp is not None and exp > time.time()
+
+    def _server_time(self):
+        seconds, microseconds = self.storage.execute('time')
+        return seconds + microseconds / 1000000
+
+    def sync(self):
+        # fetches revocations made since the last sync
+        now, server_now = time.time(), self._server_time()
+        since = '-inf' if self._synced_at is None else self._synced_at
+        members = self.storage.execute('zrangebyscore', self.log_key,
+                                       since, '+inf') or []
+        revoked = {}
+        for member in members:
+            if isinstance(member, bytes):
+                member = member.decode('utf-8')
+            digest, exp = member.split(':', 1)
+            revoked[bytes.fromhex(digest)] = float(exp)
+        with self._lock:
+            self._revoked.update(revoked)
+            for digest in [digest for digest, exp in self._revoked.items()
+                           if exp <= now]:
+                del self._revoked[digest]
+        self.storage.execute('zremrangebyscore', self.log_key, '-inf',
+                             server_now - self.max_age)
+        self._synced_at = server_now - self.overlap
+
+    def _start(self):
+        # (re)started lazily in every process, threads do not survive fork
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._synced_at = None
+        try:
+            self.sync()
+        except Exception:
+            logger.exception('Revoked tokens sync failed')
+        Thread(target=self._run, name='rester-jwt-denylist',
+               daemon=True).start()
+
+    def _run(self):
+        pid = self._pid
+        while self._pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.sync()
+            except Exception:
+                logger.exception('Revoked tokens sync failed')
@@ -21,7 +21,26 @@ class ResterSettings(dict, metaclass=Singleton):
             'PAYLOAD_LIST':
                 _django_rester_jwt_settings.get('PAYLOAD_LIST', [username]),
             'USE_REDIS': _django_rester_jwt_settings.get('USE_REDIS', False),
+            # 'allowlist' - every issued token is stored in redis and checked
+            # on each request, 'denylist' - only revoked tokens are stored
+            # and checked against local copy, synced every REVOCATION_SYNC
+            # seconds
+            'REVOCATION':
+                _django_rester_jwt_settings.get('REVOCATION', 'allowlist'),
+            'REVOCATION_SYNC':
+                _django_rester_jwt_settings.get('REVOCATION_SYNC', 5),
             'LOGIN_FIELD': username,
+            # 0 - every token signature is verified on each request
+            'TOKEN_CACHE_SIZE':
+                _django_rester_jwt_settings.get('TOKEN_CACHE_SIZE', 1024),
+            # 0 - authenticated users are not cached
+            'USER_CACHE_SIZE':
+                _django_rester_jwt_settings.get('USER_CACHE_SIZE', 0),
+            'USER_CACHE_TTL':
+                _django_rester_jwt_settings.get('USER_CACHE_TTL', 60),
+            # django cache alias for shared cache, None - in-process cache
+            'USER_CACHE_BACKEND':
+                _django_rester_jwt_settings.get('USER_CACHE_BACKEND', None),
         })
 
     @staticmethod
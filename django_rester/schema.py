@@ -0,0 +1,303 @@
+from .fields import JSONField, NO_MESSAGES
+from .stream import StreamLimitError
+
+
+def compile_structure(structure, soft=False):
+    # turns request_fields/response_fields structure into a validator
+    # closure with the JSONField.validate signature: (key, data),
+    # soft validators pass fields missing in the structure through
+    if isinstance(structure, JSONField):
+        return structure.validate
+    elif isinstance(structure, dict):
+        return (_compile_soft_dict if soft else _compile_dict)(structure)
+    elif isinstance(structure, (list, tuple)):
+        return (_compile_soft_list if soft else _compile_list)(structure)
+    return _pass if soft else _skip
+
+
+# value of a key missing in the data
+_MISSING = object()
+
+
+def _skip(key, data):
+    return None, NO_MESSAGES
+
+
+def _pass(key, data):
+    return data, NO_MESSAGES
+
+
+def _compile_dict(structure):
+    nodes = tuple((sub_key, compile_structure(sub_structure))
+                  for sub_key, sub_structure in structure.items())
+
+    def validate(key, data):
+        if not isinstance(data, dict):
+            return None, ['{} should be a dict instance'.format(key)]
+        value, messages = None, None
+        get = data.get
+        for sub_key, node in nodes:
+            val, msg = node(sub_key, get(sub_key, None))
+            if val is not None:
+                if value is None:
+                    value = {}
+                value[sub_key] = val
+            elif msg:
+                if messages is None:
+                    messages = []
+                messages += msg
+        return value, messages or NO_MESSAGES
+
+    return validate
+
+
+def _compile_list(structure):
+    node = compile_structure(structure[0])
+
+    def validate(key, data):
+        if not isinstance(data, (list, tuple)):
+            return None, ['{} should be a list or a tuple instance'.format(key)]
+        value, messages = None, None
+        for item in data:
+            val, msg = node(key, item)
+            if val is not None:
+                if value is None:
+                    value = []
+                value.append(val)
+            elif msg:
+                if messages is None:
+                    messages = []
+                messages += msg
+        return value, messages or NO_MESSAGES
+
+    return validate
+
+
+def _compile_soft_dict(structure):
+    # declared keys are validated, other keys are kept as they are,
+    # data is copied only if some value is changed by validation;
+    # missing keys are added only for fields with default (and reported
+    # for required ones)
+    nodes = tuple((sub_key, compile_structure(sub_structure, True),
+                   isinstance(sub_structure, JSONField) and (
+                       sub_structure.required
+                       or sub_structure.default is not None))
+                  for sub_key, sub_structure in structure.items())
+
+    def validate(key, data):
+        if not isinstance(data, dict):
+            return None, ['{} should be a dict instance'.format(key)]
+        value, messages = data, None
+        get = data.get
+        for sub_key, node, check_missing in nodes:
+            item = get(sub_key, _MISSING)
+            if item is _MISSING:
+                if not check_missing:
+                    continue
+                item = None
+            val, msg = node(sub_key, item)
+            if msg:
+                # nested values may be kept with messages of their fields
+                if messages is None:
+                    messages = []
+                messages += msg
+            if val is not None:
+                if val is not item:
+                    if value is data:
+                        value = dict(data)
+                    value[sub_key] = val
+                continue
+            if sub_key in data:
+                if value is data:
+                    value = dict(data)
+                del value[sub_key]
+        return value, messages or NO_MESSAGES
+
+    return validate
+
+
+def _compile_soft_list(structure):
+    node = compile_structure(structure[0], True)
+
+    def validate(key, data):
+        if not isinstance(data, (list, tuple)):
+            return None, ['{} should be a list or a tuple instance'.format(key)]
+        value, messages = None, None  # value is None until data is changed
+        for index, item in enumerate(data):
+            val, msg = node(key, item)
+            if msg:
+                if messages is None:
+                    messages = []
+                messages += msg
+            if value is None:
+                if val is item and val is not None:
+                    continue
+                value = list(data[:index])
+            if val is not None:
+                value.append(val)
+        return data if value is None else value, messages or NO_MESSAGES
+
+    return validate
+
+
+# path step for every item of a list
+_EACH = object()
+
+
+def _model_refs(structure, path=(), name=''):
+    # (path to container, key in container, key name, field) for every
+    # JSONField with model in the structure
+    refs = []
+    if isinstance(structure, dict):
+        for key, sub_structure in structure.items():
+            if isinstance(sub_structure, JSONField):
+                if sub_structure.model is not None:
+                    refs.append((path, key, key, sub_structure))
+            else:
+                refs += _model_refs(sub_structure, path + (key,), key)
+    elif isinstance(structure, (list, tuple)) and structure:
+        if isinstance(structure[0], JSONField):
+            if structure[0].model is not None:
+                refs.append((path, _EACH, name, structure[0]))
+        else:
+            refs += _model_refs(structure[0], path + (_EACH,), name)
+    return refs
+
+
+def _containers(data, path):
+    if not path:
+        yield data
+    elif path[0] is _EACH:
+        if isinstance(data, list):
+            for item in data:
+                yield from _containers(item, path[1:])
+    elif isinstance(data, dict) and path[0] in data:
+        yield from _containers(data[path[0]], path[1:])
+
+
+class ValidationPlan:
+    # precompiled validator for a single (per method) fields structure
+
+    __slots__ = ('structure', 'validate', 'list_keys', 'item',
+                 'model_refs', '_soft_validate')
+
+    def __init__(self, structure):
+        self.structure = structure
+        self.validate = compile_structure(structure)
+        self.model_refs = tuple(_model_refs(structure))
+        self._soft_validate = None
+        # list structures are also validated item by item for streams
+        self.item = ValidationPlan(structure[0]) if isinstance(
+            structure, (list, tuple)) else None
+        self.list_keys = frozenset(
+            key for key, value in structure.items()
+            if isinstance(value, (list, tuple))
+        ) if isinstance(structure, dict) else frozenset()
+
+    def __call__(self, data, key=''):
+        return self.validate(key, data)
+
+    def soft(self, data, key=''):
+        # SOFT_RESPONSE_VALIDATION: validates declared fields and keeps
+        # the rest of data in one pass, compiled on first use
+        if self._soft_validate is None:
+            self._soft_validate = compile_structure(self.structure, True)
+        return self._soft_validate(key, data)
+
+    def validate_stream(self, items):
+        # validates items of a lazy json array stream as they are parsed,
+        # stops on the first invalid item
+        validate, value = self.item.validate, []
+        try:
+            for item in items:
+                val, msg = validate('', item)
+                if msg:
+                    return None, msg
+                if val is not None:
+                    value.append(val)
+        except StreamLimitError as err:
+            return None, [str(err)]
+        except ValueError:
+            return None, ['Request data is not json serializable']
+        return value, NO_MESSAGES
+
+    def resolve_models(self, data):
+        # checks that values of fields with model exist, with one query
+        # per model and field for the whole (validated) data
+        lookups = self._model_lookups(data)
+        return self._apply_models(lookups, {
+            lookup: self._fetch(lookup, values)
+            for lookup, (values, refs) in lookups.items()})
+
+    async def aresolve_models(self, data):
+        lookups = self._model_lookups(data)
+        found = {}
+        for lookup, (values, refs) in lookups.items():
+            found[lookup] = await self._afetch(lookup, values)
+        return self._apply_models(lookups, found)
+
+    def _model_lookups(self, data):
+        # (model, field, field type) -> (values, [(container, key, name)])
+        lookups = {}
+        for path, key, name, field in self.model_refs:
+            lookup = (field.model, field.field, field.field_type)
+            values, refs = lookups.setdefault(lookup, (set(), []))
+            for container in _containers(data, path):
+                if key is _EACH:
+                    if isinstance(container, list):
+                        for index, value in enumerate(container):
+                            values.add(value)
+                            refs.append((container, index, name, field))
+                elif isinstance(container, dict) and container.get(
+                        key) is not None:
+                    values.add(container[key])
+                    refs.append((container, key, name, field))
+        return {lookup: value for lookup, value in lookups.items()
+                if value[0]}
+
+    @staticmethod
+    def _queryset(lookup, values):
+        model, field, field_type = lookup
+        return model._default_manager.filter(
+            **{'{}__in'.format(field): values})
+
+    def _fetch(self, lookup, values):
+        model, field, field_type = lookup
+        return {field_type(getattr(instance, field)): instance
+                for instance in self._queryset(lookup, values)}
+
+    async def _afetch(self, lookup, values):
+        model, field, field_type = lookup
+        return {field_type(getattr(instance, field)): instance
+                async for instance in self._queryset(lookup, values)}
+
+    @staticmethod
+    def _apply_models(lookups, found):
+        messages = []
+        for lookup, (values, refs) in lookups.items():
+            instances = found[lookup]
+            for container, key, name, field in refs:
+                instance = instances.get(container[key])
+                if instance is None:
+                    messages.append('`{}` value `{}` does not exist'.format(
+                        name, container[key]))
+                elif field.attach:
+                    container[key] = instance
+        return messages or NO_MESSAGES
+
+    def query_data(self, query):
+        # QueryDict -> dict without json round-trip, multiple values are
+        # kept only for keys described as lists, values are coerced to
+        # field types by the plan itself
+        list_keys = self.list_keys
+        return {key: query.getlist(key) if key in list_keys else query[key]
+                for key in query}
+
+
+def compile_fields(fields, methods):
+    # builds {method: ValidationPlan} mapping for request_fields or
+    # response_fields, None key is used for structures common to all methods
+    if fields and any(key in methods for key in fields):
+        return {method: ValidationPlan(structure)
+                for method, structure in fields.items() if structure}
+    return {None: ValidationPlan(fields)} if fields else {}
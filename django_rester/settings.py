@@ -1,5 +1,6 @@
 from django.conf import settings
 
+from django_rester.codec import get_codec
 from django_rester.status import HTTP_200_OK
 from django_rester.singleton import Singleton
 
@@ -38,6 +39,34 @@ class ResterSettings(dict, metaclass=Singleton):
         self.update({'SOFT_RESPONSE_VALIDATION':
                          _django_rester_settings.get('SOFT_RESPONSE_VALIDATION',
                                                      False)})
+        self.update({'JSON_BACKEND': get_codec(
+            _django_rester_settings.get('JSON_BACKEND', 'json'))})
+        # 'always', 'never', 'sampled' (RESPONSE_VALIDATION_RATE percent of
+        # responses, invalid ones are logged only) or 'debug' (settings.DEBUG)
+        self.update({'RESPONSE_VALIDATION': _django_rester_settings.get(
+            'RESPONSE_VALIDATION', 'always')})
+        self.update({'RESPONSE_VALIDATION_RATE': _django_rester_settings.get(
+            'RESPONSE_VALIDATION_RATE', 10)})
+        self.update({'ETAG': _django_rester_settings.get('ETAG', False)})
+        # request body limits checked before it is read, None - no limit
+        self.update({'MAX_BODY_SIZE': _django_rester_settings.get(
+            'MAX_BODY_SIZE', None)})
+        self.update({'ALLOWED_CONTENT_TYPES': _django_rester_settings.get(
+            'ALLOWED_CONTENT_TYPES', None)})
+        self.update({'AUTH_BEFORE_PARSE': _django_rester_settings.get(
+            'AUTH_BEFORE_PARSE', False)})
+        # True or redis db number to share throttling counters between
+        # processes, in-process token buckets otherwise
+        self.update({'THROTTLE_REDIS': _django_rester_settings.get(
+            'THROTTLE_REDIS', False)})
+        self.update({'THROTTLE_SYNC': _django_rester_settings.get(
+            'THROTTLE_SYNC', 1)})
+        self.update({'THROTTLE_MAX_KEYS': _django_rester_settings.get(
+            'THROTTLE_MAX_KEYS', 100000)})
+        self.update({'INSTRUMENTATION': _django_rester_settings.get(
+            'INSTRUMENTATION', False)})
+        self.update({'SERVER_TIMING': _django_rester_settings.get(
+            'SERVER_TIMING', True)})
 
     @staticmethod
     def _set_response_structure(structure):
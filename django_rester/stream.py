@@ -0,0 +1,179 @@
+import codecs
+import json
+
+STREAM_CHUNK_SIZE = 64 * 1024
+# partial literals/numbers/escapes at the end of the buffer are not errors
+_INCOMPLETE_TAIL = 16
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789.eE+-'
+
+
+class StreamLimitError(ValueError):
+    # body or array item is larger than allowed
+    pass
+
+
+class JSONArrayParser:
+    """Incremental parser for a top-level json array.
+
+    Bytes are pushed with feed(), which returns the list of array items
+    completed so far, close() should be called after the last chunk.
+    Only the current (unfinished) item is kept in memory, ValueError is
+    raised as soon as the input could not be a json array any more.
+    With `key` the array is looked up in a top-level json object (like
+    {"success": true, "data": [...]}), other values of the object are
+    collected into `envelope`.
+    """
+
+    def __init__(self, max_item_size=None, key=None):
+        self.max_item_size = max_item_size
+        self.key = key
+        self.envelope = {}
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._raw_decode = json.JSONDecoder().raw_decode
+        self._buffer = ''
+        # chunks are joined to the buffer only when it is parsed again
+        self._pending = []
+        self._size = 0
+        self._retry_size = 0
+        self._state = 'start'
+        self._current_key = None
+
+    def feed(self, data, final=False):
+        text = self._decoder.decode(data, final)
+        self._pending.append(text)
+        self._size += len(text)
+        if not final and self._size < self._retry_size and (
+                self.max_item_size is None
+                or self._size <= self.max_item_size):
+            return []
+        self._buffer += ''.join(self._pending)
+        self._pending = []
+        items = []
+        buffer, pos, state = self._buffer, 0, self._state
+        length = len(buffer)
+        while True:
+            while pos < length and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= length:
+                break
+            char = buffer[pos]
+            if state == 'start':
+                if self.key is not None and char == '{':
+                    pos, state = pos + 1, 'first_key'
+                elif char == '[':
+                    pos, state = pos + 1, 'first'
+                else:
+                    raise ValueError('json array expected')
+            elif state in ('first', 'sep') and char == ']':
+                # the array could be a value of the top-level object
+                pos, state = pos + 1, (
+                    'end' if self._current_key is None else 'next')
+            elif state == 'sep':
+                if char != ',':
+                    raise ValueError(
+                        "Expecting ',' delimiter: char {}".format(pos))
+                pos, state = pos + 1, 'value'
+            elif state in ('first', 'value'):
+                decoded = self._decode(buffer, pos, length, final)
+                if decoded is None:
+                    break
+                if (self.max_item_size is not None
+                        and decoded[1] - pos > self.max_item_size):
+                    raise StreamLimitError('json array item is too large')
+                items.append(decoded[0])
+                pos, state = decoded[1], 'sep'
+            elif state in ('first_key', 'key'):
+                if state == 'first_key' and char == '}':
+                    pos, state = pos + 1, 'end'
+                    continue
+                if char != '"':
+                    raise ValueError(
+                        'Expecting property name: char {}'.format(pos))
+                decoded = self._decode(buffer, pos, length, final)
+                if decoded is None:
+                    break
+                self._current_key, pos, state = decoded[0], decoded[1], 'colon'
+            elif state == 'colon':
+                if char != ':':
+                    raise ValueError(
+                        "Expecting ':' delimiter: char {}".format(pos))
+                pos, state = pos + 1, 'object_value'
+            elif state == 'object_value':
+                if self._current_key == self.key and char == '[':
+                    pos, state = pos + 1, 'first'
+                    continue
+                decoded = self._decode(buffer, pos, length, final)
+                if decoded is None:
+                    break
+                self.envelope[self._current_key] = decoded[0]
+                pos, state = decoded[1], 'next'
+            elif state == 'next':
+                if char == '}':
+                    pos, state = pos + 1, 'end'
+                elif char == ',':
+                    pos, state = pos + 1, 'key'
+                else:
+                    raise ValueError(
+                        "Expecting ',' delimiter: char {}".format(pos))
+            else:
+                raise ValueError('Extra data: char {}'.format(pos))
+        self._buffer, self._state = buffer[pos:], state
+        self._size = len(self._buffer)
+        if self.max_item_size is not None and self._size > self.max_item_size:
+            raise StreamLimitError('json array item is too large')
+        # the value at the buffer start is not complete, it is decoded again
+        # when the buffer is twice bigger, so a big value is not re-decoded
+        # from its start on every chunk
+        self._retry_size = 2 * self._size
+        return items
+
+    def close(self):
+        items = self.feed(b'', final=True)
+        if self._state != 'end':
+            raise ValueError('json array is not complete')
+        return items
+
+    def _decode(self, buffer, pos, length, final):
+        # returns (value, end) or None if the value is not complete yet
+        try:
+            value, end = self._raw_decode(buffer, pos)
+        except json.JSONDecodeError as err:
+            if final or not self._incomplete(err, length):
+                raise ValueError(str(err))
+            return None
+        if not final and (end >= length or (
+                isinstance(value, (int, float))
+                and not buffer[end:].strip(_NUMBER_CHARS))):
+            # number could be continued in the next chunk
+            return None
+        return value, end
+
+    @staticmethod
+    def _incomplete(err, length):
+        return (err.msg.startswith('Unterminated string')
+                or length - err.pos <= _INCOMPLETE_TAIL)
+
+
+class JSONArrayStream:
+    # lazy iterator over items of a json array read from file-like object
+
+    def __init__(self, read, chunk_size=STREAM_CHUNK_SIZE,
+                 max_item_size=None, max_size=None):
+        self.read = read
+        self.chunk_size = chunk_size
+        self.max_item_size = max_item_size
+        self.max_size = max_size
+
+    def __iter__(self):
+        parser = JSONArrayParser(self.max_item_size)
+        size = 0
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if self.max_size is not None and size > self.max_size:
+                raise StreamLimitError('Request body is too large')
+            yield from parser.feed(chunk)
+        yield from parser.close()
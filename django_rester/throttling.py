@@ -0,0 +1,159 @@
+import logging
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+
+from .settings import rester_settings
+
+logger = logging.getLogger('django_rester')
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1,
+           'm': 60, 'min': 60, 'minute': 60,
+           'h': 60 * 60, 'hour': 60 * 60,
+           'd': 60 * 60 * 24, 'day': 60 * 60 * 24}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    # '100/min' or (100, 60) -> (requests number, period in seconds)
+    if isinstance(rate, str):
+        number, period = rate.split('/', 1)
+        return int(number), PERIODS[period.strip().lower()]
+    return int(rate[0]), float(rate[1])
+
+
+class TokenBuckets:
+    """In-process token buckets, one per key.
+
+    Bucket holds `limit` tokens at most and is refilled with `limit`
+    tokens per `period` seconds, every request takes one token. Least
+    recently used buckets are dropped if there are more than max_keys.
+    """
+    blocking = False
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated at]
+        self._lock = Lock()
+
+    def allow(self, key, limit, period):
+        # (allowed, seconds to wait for the next token)
+        now = time.monotonic()
+        rate = limit / period
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [limit, now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                return False, (1 - bucket[0]) / rate
+            bucket[0] -= 1
+        return True, 0
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisWindows:
+    """Fixed window counters shared between processes through redis.
+
+    Requests are counted locally and added to the redis counter of the
+    window (INCRBY) every `interval` seconds per key, so redis is not hit
+    on every request, and the limit could be exceeded by the requests of
+    the last interval in other processes.
+    """
+    blocking = True
+    key_prefix = '_throttle:'
+
+    def __init__(self, storage, interval=1, max_keys=100000):
+        self.storage = storage
+        self.interval = interval
+        self.max_keys = max_keys
+        # (key, window) -> [shared count, not synced count, synced at]
+        self._counters = OrderedDict()
+        self._lock = Lock()
+
+    def allow(self, key, limit, period):
+        now = time.time()
+        window = int(now // period)
+        retry_after = (window + 1) * period - now
+        with self._lock:
+            counter = self._counters.get((key, window))
+            if counter is None:
+                counter = self._counters[(key, window)] = [0, 0, 0]
+                self._counters.pop((key, window - 1), None)
+                while len(self._counters) > self.max_keys:
+                    self._counters.popitem(last=False)
+            if counter[0] + counter[1] >= limit:
+                return False, retry_after
+            counter[1] += 1
+            delta = 0
+            if now - counter[2] >= self.interval:
+                delta, counter[1], counter[2] = counter[1], 0, now
+        if delta:
+            self._sync(key, window, period, counter, delta)
+        return True, 0
+
+    def _sync(self, key, window, period, counter, delta):
+        name = '{}{}:{}'.format(self.key_prefix, key, window)
+        try:
+            shared = self.storage.execute('incrby', name, delta)
+            self.storage.execute('expire', name, int(period) + 1)
+        except Exception:
+            logger.exception('Throttling counters sync failed')
+            shared = None
+        with self._lock:
+            if shared:
+                counter[0] = max(counter[0] + delta, int(shared))
+            else:
+                # local counting only while redis is not available
+                counter[0] += delta
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+
+
+_store = None
+
+
+def get_store():
+    # created on the first use from THROTTLE_REDIS setting
+    global _store
+    if _store is None:
+        use_redis = rester_settings['THROTTLE_REDIS']
+        if use_redis:
+            from django_rediser import RedisStorage
+            db = None
+            if isinstance(use_redis, int) and not isinstance(use_redis, bool):
+                db = use_redis
+            _store = RedisWindows(RedisStorage(db=db),
+                                  rester_settings['THROTTLE_SYNC'],
+                                  rester_settings['THROTTLE_MAX_KEYS'])
+        else:
+            _store = TokenBuckets(rester_settings['THROTTLE_MAX_KEYS'])
+    return _store
+
+
+def get_identity(request, key='token', auth=None):
+    # client identity: digest of the auth token verified before ('token')
+    # or its user claims ('user', all tokens of the user share the limit),
+    # client address for requests without such token (so rotated fake
+    # tokens do not get new limits), client address ('ip') or key(request)
+    # result for callable key (e.g. view method)
+    if callable(key):
+        return str(key(request))
+    if key in ('token', 'user'):
+        verified_key = getattr(auth, 'verified_{}_key'.format(key), None)
+        if verified_key is not None:
+            identity = verified_key(request)
+            if identity:
+                return identity
+    return request.META.get('REMOTE_ADDR', '')
@@ -1,16 +1,42 @@
-import json
+import datetime
 import logging
-from json import JSONDecodeError
+import math
+import random
+from collections import Counter
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from inspect import isawaitable, iscoroutinefunction
+from io import BytesIO
 
-from django.http import HttpResponse
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    QueryDict,
+    StreamingHttpResponse,
+)
+from django.http.response import HttpResponseBase
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.urls import Resolver404, resolve
+from django.utils.http import http_date, quote_etag
 from django.views import View
-from django.views.decorators.csrf import csrf_exempt
+from .cache import LRUCache
 from .decorators import permissions
 from .permission import IsAuthenticated
 from .status import (
     HTTP_200_OK,
     HTTP_500_INTERNAL_SERVER_ERROR,
-    HTTP_400_BAD_REQUEST
+    HTTP_400_BAD_REQUEST,
+    HTTP_401_UNAUTHORIZED,
+    HTTP_404_NOT_FOUND,
+    HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+    HTTP_429_TOO_MANY_REQUESTS,
 )
 from .exceptions import (
     RequestStructureException,
@@ -23,18 +49,77 @@ from .exceptions import (
 )
 
 from . import fields
+from .instrumentation import start_timing, finish_timing
+from .schema import compile_fields, compile_structure
 from .settings import rester_settings
+from .stream import JSONArrayStream
+from .throttling import get_identity, get_store, parse_rate
 
 logger = logging.getLogger('django_rester')
 
+# placeholder for streamed data inside RESPONSE_STRUCTURE envelope
+STREAM_PLACEHOLDER = '__django_rester_stream__'
+STREAM_CHUNK_SIZE = 64 * 1024
+_STREAM_EMPTY = object()
+
+REQUEST_STRUCTURE_MESSAGE = ('request data structure is not valid, '
+                             'check for documentation')
+RESPONSE_STRUCTURE_MESSAGE = ('response data structure is not valid, '
+                              'check for documentation or leave blank')
+
+# response validation policies
+VALIDATE_ALWAYS = 'always'
+VALIDATE_NEVER = 'never'
+VALIDATE_SAMPLED = 'sampled'
+VALIDATE_DEBUG = 'debug'
+
+# (view name, method) -> number of invalid responses found by sampling
+response_violations = Counter()
+
+# structures compiled for _check_json_field: id -> (structure, plan), the
+# structure is kept with its plan, so its id() is not reused
+_structure_plans = LRUCache(256)
+
+
+def _compiled_structure(structure):
+    cached = _structure_plans.get(id(structure))
+    if cached is None or cached[0] is not structure:
+        cached = (structure, compile_structure(structure))
+        _structure_plans.set(id(structure), cached)
+    return cached[1]
+
 
 class BaseAPIView(View):
     auth = rester_settings['AUTH_BACKEND']()
     request_fields, response_fields = {}, {}
+    # parse list request bodies incrementally from request stream
+    stream_request = False
+    # max streamed body and item sizes in bytes,
+    # None - DATA_UPLOAD_MAX_MEMORY_SIZE
+    stream_max_size = None
+    stream_max_item_size = None
+    # RESPONSE_VALIDATION and RESPONSE_VALIDATION_RATE for the view,
+    # None - global settings are used
+    response_validation = None
+    response_validation_rate = None
+    # ETAG setting for the view, None - global setting is used
+    etag = None
+    # requests limits by method, e.g. {'GET': '100/min', 'POST': '10/s'}
+    throttle_rates = {}
+    # 'token', 'user', 'ip' or a method(request) returning client identity
+    throttle_key = 'token'
+    # MAX_BODY_SIZE, ALLOWED_CONTENT_TYPES and AUTH_BEFORE_PARSE settings
+    # for the view, None - global settings are used
+    max_body_size = None
+    allowed_content_types = None
+    auth_before_parse = None
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.request_data = None
+        self._timing = None
+        self._version = (None, None)  # (etag, last modified timestamp)
+        self._cached = None  # (response cache, key, lock) of cached_response
 
     @classmethod
     def get_login_field(cls):
@@ -47,17 +132,37 @@ class BaseAPIView(View):
     def as_view(cls, **kwargs):
         view = super(BaseAPIView, cls).as_view()
         view.cls = cls
-        return csrf_exempt(view)
-
-    @property
-    def _common_request_response_structure(self):
-        # check if request_fields are common to any http method or not
-        common_structure = False
-        for key in self.request_fields.keys():
-            if key in self._allowed_methods():
-                common_structure = True
-                break
-        return common_structure
+        # same as csrf_exempt, but keeps async views marked as coroutines
+        view.csrf_exempt = True
+        return view
+
+    def _allowed_methods(self):
+        # handlers are defined on the view class, so the list is built once
+        allowed = type(self).__dict__.get('_allowed_methods_list')
+        if allowed is None:
+            allowed = super()._allowed_methods()
+            type(self)._allowed_methods_list = allowed
+        return allowed
+
+    def _get_plan(self, fields, method):
+        # validation plans of class level fields are compiled once per view
+        # class on first use, fields assigned to the instance are not cached
+        view_class = type(self)
+        if not any(fields is getattr(view_class, name, None)
+                   for name in ('request_fields', 'response_fields')):
+            compiled = compile_fields(fields, self._allowed_methods())
+            return compiled.get(method, compiled.get(None))
+        plans = view_class.__dict__.get('_validation_plans')
+        if plans is None:
+            plans = {}
+            view_class._validation_plans = plans
+        # fields are kept with the plan, so their id() is not reused
+        cached = plans.get(id(fields))
+        if cached is None or cached[0] is not fields:
+            cached = plans[id(fields)] = (
+                fields, compile_fields(fields, self._allowed_methods()))
+        compiled = cached[1]
+        return compiled.get(method, compiled.get(None))
 
     def _set_response(self, _response):
         if isinstance(_response, (list, tuple)) and len(_response) == 2:
@@ -66,13 +171,13 @@ class BaseAPIView(View):
         else:
             response = _response
             status = HTTP_200_OK
-        if isinstance(response, HttpResponse):
+        if isinstance(response, HttpResponseBase):
             result = response
         else:
             try:
-                pure_response = json.dumps(response)
+                pure_response = rester_settings['JSON_BACKEND'].dumps(response)
                 content_type = 'application/json'
-            except TypeError:
+            except (TypeError, ValueError):
                 pure_response = str(response)
                 status = HTTP_500_INTERNAL_SERVER_ERROR
                 content_type = 'text/plain'
@@ -85,32 +190,66 @@ class BaseAPIView(View):
                        exception_message, msg_key='validate'):
         if fields == {}:
             return data
-        if self._common_request_response_structure:
-            structure = fields.get(method, None)
-        else:
-            structure = fields
-        if not structure and method not in rester_settings.get(
-                'FIELDS_CHECK_EXCLUDED_METHODS', []):
-            raise exception(exception_message)
-        structured_data, messages = self._check_json_field(data, structure)
+        structured_data, messages = self._structure_validate(
+            method, data, fields, exception, exception_message)
         if not messages:
-            try:
-                structured_data = self.custom_validation(structured_data)
-                assert structured_data is not None, \
-                    '.custom_validation() should return ' \
-                    'validated structured data'
-            except (AssertionError, CustomValidationException) as exc:
-                messages = ['{}'.format(exc)]
-        if fields is self.response_fields and rester_settings.get(
-                'SOFT_RESPONSE_VALIDATION', False):
-            structured_data = self._add_filtered_data(data, structured_data)
+            messages = self._model_validate(method, fields, structured_data)
+        if not messages:
+            structured_data, messages = self._custom_validate(structured_data)
+        return self._validation_result(structured_data, messages, exception,
+                                       exception_message, msg_key)
+
+    def _structure_validate(self, method, data, fields, exception,
+                            exception_message):
+        plan = self._get_plan(fields, method)
+        if plan is None:
+            if method not in rester_settings.get(
+                    'FIELDS_CHECK_EXCLUDED_METHODS', []):
+                raise exception(exception_message)
+            return None, []
+        elif fields is self.response_fields:
+            if rester_settings.get('SOFT_RESPONSE_VALIDATION', False):
+                return plan.soft(data)
+            return plan(data)
+        elif isinstance(data, JSONArrayStream):
+            return plan.validate_stream(data)
+        return plan(data)
+
+    def _model_plan(self, method, fields):
+        # request plan with fields with model, if any
+        if fields is self.response_fields:
+            return None
+        plan = self._get_plan(fields, method)
+        return plan if plan is not None and plan.model_refs else None
+
+    def _model_validate(self, method, fields, structured_data):
+        # all values of fields with model are checked with one query
+        # per model, see ValidationPlan.resolve_models
+        plan = self._model_plan(method, fields)
+        if plan is None:
+            return []
+        return plan.resolve_models(structured_data)
+
+    def _custom_validate(self, structured_data):
+        try:
+            structured_data = self.custom_validation(structured_data)
+            assert structured_data is not None, \
+                '.custom_validation() should return validated structured data'
+        except (AssertionError, CustomValidationException) as exc:
+            return structured_data, ['{}'.format(exc)]
+        return structured_data, []
+
+    @staticmethod
+    def _validation_result(structured_data, messages, exception,
+                           exception_message, msg_key):
         if messages:
             messages = [exception_message, {msg_key: messages}]
             raise exception(messages, HTTP_500_INTERNAL_SERVER_ERROR)
         return structured_data
 
     def _add_filtered_data(self, data, structured_data):
-        # recursive function, validates response_data by response_fields
+        # recursive function, validates response_data by response_fields,
+        # views validate soft responses in one pass, see ValidationPlan.soft
         value = None
         if isinstance(data, dict):
             for data_key, data_value in data.items():
@@ -138,39 +277,12 @@ class BaseAPIView(View):
         return value
 
     def _check_json_field(self, data, structure, key='', messages=None):
-        # recursive function, validates request_data by request_fields
-        value = None
+        # validates data by request_fields/response_fields structure,
+        # views use precompiled plans, see _get_plan
         if messages is None:
             messages = []
-        if isinstance(structure, fields.JSONField):
-            value, msg = structure.validate(key, data)
-            messages += msg
-        elif isinstance(structure, dict):
-            if not isinstance(data, dict):
-                messages.append('{} should be a dict instance'.format(key))
-            else:
-                for sub_key, sub_structure in structure.items():
-                    val, msg = self._check_json_field(data.get(sub_key, None),
-                                                      sub_structure, sub_key)
-                    if val is not None:
-                        if value is None:
-                            value = {}
-                        value[sub_key] = val
-                    else:
-                        messages += msg
-        elif isinstance(structure, (list, tuple)):
-            if not isinstance(data, (list, tuple)):
-                messages.append(
-                    '{} should be a list or a tuple instance'.format(key))
-            else:
-                for item in data:
-                    val, msg = self._check_json_field(item, structure[0], key)
-                    if val is not None:
-                        if value is None:
-                            value = []
-                        value.append(val)
-                    else:
-                        messages += msg
+        value, msg = _compiled_structure(structure)(key, data)
+        messages += msg
         return value, messages
 
     def _set_request_data(self, request):
@@ -179,19 +291,55 @@ class BaseAPIView(View):
         if method in self._allowed_methods():
             try:
                 if method == 'GET':
-                    request_data = json.loads(
-                        json.dumps(request.GET)) if request.GET else {}
+                    request_data = self._query_data(request.GET)
                 elif method in ('POST', 'PUT', 'PATCH'):
-                    request_data = json.loads(
-                        request.body.decode('utf-8')) if request.body else {}
+                    request_data = self._stream_request_data(request)
+                    if request_data is None:
+                        request_data = rester_settings['JSON_BACKEND'].loads(
+                            request.body) if request.body else {}
                 elif method in ('OPTIONS', 'HEAD'):
                     request_data = {}
-                if not isinstance(request_data, (dict, list)):
-                    raise JSONDecodeError
-            except JSONDecodeError:
+                if not isinstance(request_data,
+                                  (dict, list, JSONArrayStream)):
+                    raise ValueError
+            except ValueError:
                 messages.append('Request data is not json serializable')
         return request_data, messages
 
+    def _stream_plan(self, method):
+        # request structure plan of stream_request view with list structure
+        if not self.stream_request:
+            return None
+        plan = self._get_plan(self.request_fields, method)
+        if plan is None or plan.item is None:
+            return None
+        return plan
+
+    def _stream_request_data(self, request):
+        # body is read lazily and validated item by item in _data_validate,
+        # only for views with stream_request and list request structure
+        if self._stream_plan(request.method) is None:
+            return None
+        max_size, max_item_size = self.stream_max_size, \
+            self.stream_max_item_size
+        if max_size is None:
+            max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        body_max_size = self._max_body_size()
+        if body_max_size is not None:
+            # None is no limit
+            max_size = body_max_size if max_size is None else min(
+                max_size, body_max_size)
+        if max_item_size is None:
+            max_item_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        return JSONArrayStream(request.read, max_item_size=max_item_size,
+                               max_size=max_size)
+
+    def _query_data(self, query):
+        if not query:
+            return {}
+        plan = self._get_plan(self.request_fields, 'GET')
+        return plan.query_data(query) if plan else query.dict()
+
     def custom_validation(self, structured_data):
         # Override this method for custom validation
         # Only CustomValidationException should be raised here
@@ -199,43 +347,250 @@ class BaseAPIView(View):
         return structured_data or {}
 
     def dispatch(self, request, *args, **kwargs):
-        self.request_data, messages = self._set_request_data(request)
-        resp, response_status = [], None
+        self._timing = start_timing()
+        rejected = self._reject(request)
+        if rejected is not None:
+            return self._finish_response(request, rejected)
+        resp, response_status, messages = [], None, []
+        auth_before_parse = self._auth_before_parse()
+        if auth_before_parse:
+            messages = self._set_user(request,
+                                      *self._authenticate(request))
+            if not messages:
+                rejected = self._check_permissions(request)
+                if rejected is not None:
+                    return self._finish_response(request, rejected)
+        if not messages:
+            self.request_data, messages = self._set_request_data(request)
+            self._mark('parse')
         if not messages:
-            user, messages = self.auth.authenticate(request)
-            if not messages and user:
-                request.user = user
+            if not auth_before_parse:
+                messages = self._set_user(request,
+                                          *self._authenticate(request))
             try:
                 self.request_data = self._data_validate(
                     request.method, self.request_data, self.request_fields,
-                    RequestStructureException,
-                    'request data structure is not valid, '
-                    'check for documentation',
+                    RequestStructureException, REQUEST_STRUCTURE_MESSAGE,
                     'request'
                 )
             except RequestStructureException as err:
                 messages = err.messages
                 response_status = err.response_status
-            method_name = request.method.lower()
+            self._mark('request_validation')
             if not messages:
-                if method_name in self.http_method_names:
-                    handler = getattr(self, method_name,
-                                      self.http_method_not_allowed)
-                else:
-                    handler = self.http_method_not_allowed
-
-                # TODO refactor this somehow
-                # if method_name in ('options',):
-                #     _response = handler(request, *args, **kwargs)
-                # else:
-                resp, response_status = \
-                    self.try_response(handler, request, *args, **kwargs)
+                not_modified = self._not_modified(request, *args, **kwargs)
+                if not_modified is not None:
+                    return self._finish_response(request, not_modified)
+                resp, response_status = self.try_response(
+                    self._get_handler(request), request, *args, **kwargs)
+        response = self._dispatch_response(resp, response_status, messages)
+        if self._cached is not None:
+            cache, key, lock = self._cached
+            cache.store(key, response, lock)
+        return self._finish_response(request, self._set_etag(request,
+                                                             response))
+
+    def _authenticate(self, request):
+        # sub-requests of BatchAPIView are authenticated once by the batch
+        batch_auth = getattr(request, 'batch_auth', None)
+        if batch_auth is not None:
+            return batch_auth
+        return self.auth.authenticate(request)
+
+    def _set_user(self, request, user, messages):
+        self._mark('auth')
+        if not messages and user:
+            request.user = user
+        return messages
+
+    def _auth_before_parse(self):
+        if self.auth_before_parse is None:
+            return rester_settings['AUTH_BEFORE_PARSE']
+        return self.auth_before_parse
+
+    def _check_permissions(self, request):
+        # @permissions of the handler are checked before parsing with
+        # auth_before_parse (results are cached on request for decorator)
+        for permission in getattr(self._get_handler(request),
+                                  'permissions', ()):
+            checked, message = permission.evaluate(request)
+            if not checked:
+                return self._set_response(self._handler_response(
+                    message, [], HTTP_401_UNAUTHORIZED))
+        return None
+
+    def _reject(self, request):
+        # cheap checks before the request body is read
+        rejected = self._throttle(request)
+        if rejected is None:
+            rejected = self._check_body(request)
+        return rejected
+
+    def _check_body(self, request):
+        # 413 or 415 response by Content-Length and Content-Type headers,
+        # body of unknown length (chunked) is read up to the size limit,
+        # streamed body is limited while it is parsed
+        if request.method not in ('POST', 'PUT', 'PATCH'):
+            return None
+        try:
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            length = None
+        max_size = self._max_body_size()
+        if length is None and max_size is not None and \
+                self._stream_plan(request.method) is None:
+            length = len(self._read_body(request, max_size))
+        if length == 0:
+            return None
+        if max_size is not None and length is not None and length > max_size:
+            return self._error_response('Request body is too large',
+                                        HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        content_types = self.allowed_content_types
+        if content_types is None:
+            content_types = rester_settings['ALLOWED_CONTENT_TYPES']
+        if content_types is not None and \
+                request.content_type not in content_types:
+            return self._error_response(
+                'Content type {} is not allowed'.format(request.content_type),
+                HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        return None
+
+    def _max_body_size(self):
+        if self.max_body_size is None:
+            return rester_settings['MAX_BODY_SIZE']
+        return self.max_body_size
+
+    @staticmethod
+    def _read_body(request, max_size):
+        # max_size + 1 bytes of the body at most, the body is kept for
+        # parsing if it is not too large
+        body = getattr(request, '_body', None)
+        if body is None:
+            body = request.read(max_size + 1)
+            if len(body) <= max_size:
+                request._body = body
+                request._stream = BytesIO(body)
+        return body
+
+    def _error_response(self, message, status):
+        return self._set_response((self.set_response_structure(
+            data=None, success=False, message=[message]), status))
+
+    def _throttle(self, request):
+        # 429 response if the client exceeded the method rate, request
+        # body is not parsed then
+        rate = self.throttle_rates.get(request.method)
+        if rate is None:
+            return None
+        limit, period = parse_rate(rate)
+        key = '{}.{}:{}:{}'.format(
+            type(self).__module__, type(self).__qualname__, request.method,
+            get_identity(request, self.throttle_key, self.auth))
+        allowed, retry_after = get_store().allow(key, limit, period)
+        if allowed:
+            return None
+        response = self._error_response('Request limit exceeded',
+                                        HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(max(math.ceil(retry_after), 1))
+        return response
+
+    def get_etag(self, request, *args, **kwargs):
+        # Override to return a cheap version key of GET response (e.g.
+        # object's updated_at), the handler is not called at all if the
+        # client already has this version (If-None-Match)
+        return None
+
+    def get_last_modified(self, request, *args, **kwargs):
+        # Override to return datetime of the last change of GET response,
+        # for If-Modified-Since requests
+        return None
+
+    def _not_modified(self, request, *args, **kwargs):
+        # @permissions of the handler are checked before get_etag, so
+        # conditional GET can't be used to bypass them
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        rejected = self._check_permissions(request)
+        if rejected is not None:
+            return rejected
+        return self._conditional_response(
+            request, *self._get_version(request, *args, **kwargs))
+
+    def _get_version(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None, None
+        return (self.get_etag(request, *args, **kwargs),
+                self.get_last_modified(request, *args, **kwargs))
+
+    def _conditional_response(self, request, etag, last_modified):
+        # 304 (or 412) response if the client has the current version
+        if etag is None and last_modified is None:
+            return None
+        if etag is not None:
+            etag = quote_etag(str(etag))
+        if last_modified is not None:
+            if timezone.is_naive(last_modified):
+                last_modified = timezone.make_aware(last_modified,
+                                                    datetime.timezone.utc)
+            last_modified = int(last_modified.timestamp())
+        self._version = (etag, last_modified)
+        response = get_conditional_response(request, etag, last_modified)
+        if response is not None:
+            self._set_version_headers(response)
+            response = self._set_cors(response)
+        return response
+
+    def _set_etag(self, request, response):
+        # ETag of successful GET response: version from get_etag() or
+        # a hash of the content (if ETAG is enabled)
+        if (request.method not in ('GET', 'HEAD')
+                or response.status_code != 200 or response.streaming):
+            return response
+        self._set_version_headers(response)
+        if response.has_header('ETag'):
+            return response
+        etag = self.etag
+        if etag is None:
+            etag = rester_settings['ETAG']
+        if not etag:
+            return response
+        response['ETag'] = '"{}"'.format(
+            blake2b(response.content, digest_size=16).hexdigest())
+        conditional = get_conditional_response(
+            request, response['ETag'], response=response)
+        if conditional is not response:
+            conditional = self._set_cors(conditional)
+        return conditional
+
+    def _set_version_headers(self, response):
+        etag, last_modified = self._version
+        if etag is not None:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+
+    def _mark(self, phase):
+        if self._timing is not None:
+            self._timing.mark(phase)
+
+    def _finish_response(self, request, response):
+        if self._timing is not None:
+            self._timing.mark('serialization')
+            finish_timing(self, request, response, self._timing)
+        return response
+
+    def _get_handler(self, request):
+        method_name = request.method.lower()
+        if method_name in self.http_method_names:
+            return getattr(self, method_name, self.http_method_not_allowed)
+        return self.http_method_not_allowed
+
+    def _dispatch_response(self, resp, response_status, messages):
         if not resp:
             resp = self.set_response_structure(
                 data=None, success=False, message=messages)
             response_status = HTTP_400_BAD_REQUEST
-        resp = self._set_response((resp, response_status))
-        return resp
+        return self._set_response((resp, response_status))
 
     @staticmethod
     def _set_cors(result):
@@ -266,56 +621,194 @@ class BaseAPIView(View):
         return result
 
     def try_response(self, handler, request, *args, **kwargs):
-        message = []
-        success = None
         data = None
+        self._log_request(request)
+        try:
+            data, response_status = self._handler_result(
+                handler(request, *args, **kwargs))
+            self._mark('handler')
+            data = self._response_validate(request, data, response_status)
+        except Exception as err:
+            self._mark_error()
+            data, message, response_status = self._handler_error(
+                request, err, data)
+        else:
+            message = []
+        self._mark('response_validation')
+        return self._handler_response(data, message, response_status)
+
+    def _mark_error(self):
+        # time before the error is counted as handler or validation time
+        if self._timing is not None and 'handler' not in self._timing.phases:
+            self._timing.mark('handler')
+
+    def _log_request(self, request):
         logger.debug('Request: [{} {}] {}'.format(request.method, request.path,
                                                   self.request_data))
+
+    @staticmethod
+    def _handler_result(data):
+        if isinstance(data, HttpResponseBase):
+            return data, data.status_code
+        elif isinstance(data, tuple) and len(data) == 2:
+            return data[0], data[1]
+        return data, HTTP_200_OK
+
+    def _response_validate(self, request, data, response_status):
+        if isinstance(data, HttpResponseBase):
+            return data
+        policy = self._response_policy()
+        if isinstance(data, (Iterator, QuerySet)):
+            return self._stream_response(request.method, data,
+                                         response_status, policy)
+        elif policy == VALIDATE_NEVER:
+            return data
+        elif policy == VALIDATE_SAMPLED:
+            structured_data, messages = self._response_check(request.method,
+                                                             data)
+            if not messages:
+                structured_data, messages = self._custom_validate(
+                    structured_data)
+            self._response_violation(request.method, messages)
+            return data
+        return self._data_validate(
+            request.method, data, self.response_fields,
+            ResponseStructureException, RESPONSE_STRUCTURE_MESSAGE,
+            'response'
+        )
+
+    def _response_policy(self):
+        # resolves the policy for the current response: always, never or
+        # sampled (validated, but invalid response is not an error)
+        policy = (self.response_validation
+                  or rester_settings['RESPONSE_VALIDATION'])
+        if policy == VALIDATE_DEBUG:
+            return VALIDATE_ALWAYS if settings.DEBUG else VALIDATE_NEVER
+        elif policy == VALIDATE_SAMPLED:
+            rate = self.response_validation_rate
+            if rate is None:
+                rate = rester_settings['RESPONSE_VALIDATION_RATE']
+            return VALIDATE_SAMPLED if random.random() * 100 < rate \
+                else VALIDATE_NEVER
+        return policy
+
+    def _response_check(self, method, data):
+        # sampled validation: response is checked, but not changed
+        if self.response_fields == {}:
+            return data, []
         try:
-            success = True
-            data = handler(request, *args, **kwargs)
-            if isinstance(data, HttpResponse):
-                response_status = data.status_code
-            else:
-                response_status = HTTP_200_OK
-                if isinstance(data, tuple) and len(data) == 2:
-                    response_status = data[1]
-                    data = data[0]
-                data = self._data_validate(
-                    request.method, data, self.response_fields,
-                    ResponseStructureException,
-                    'response data structure is not valid, '
-                    'check for documentation or leave blank',
-                    'response'
-                )
-        except (ResponseStructureException, ResponseError) as err:
-            logger.exception('Error in handler for [{}]'.format(request.path))
-            response_status = err.response_status
-            if isinstance(err, (ResponseBadRequestMsgList,
-                                ResponseStructureException)):
-                response_status = err.response_status
-                message = err.messages
-            elif isinstance(err, (ResponseOkMessage, ResponseFailMessage)):
-                response_status = err.response_status
-                message = err.message
-                data = err.data
-            else:
-                message = '{}'.format(err)
-            success = isinstance(err, ResponseOkMessage)
-        except Exception as err:
-            logger.exception('Error in handler for [{}]'.format(request.path))
+            return self._structure_validate(
+                method, data, self.response_fields,
+                ResponseStructureException, RESPONSE_STRUCTURE_MESSAGE)
+        except ResponseStructureException as err:
+            return data, err.messages
+
+    def _response_violation(self, method, messages):
+        if not messages:
+            return
+        response_violations[(type(self).__name__, method)] += 1
+        logger.warning('Response of {} [{}] is not valid: {}'.format(
+            type(self).__name__, method, messages))
+
+    @staticmethod
+    def _handler_error(request, err, data):
+        logger.exception('Error in handler for [{}]'.format(request.path))
+        if isinstance(data, (Iterator, QuerySet)):
+            data = None
+        if isinstance(err, (ResponseBadRequestMsgList,
+                            ResponseStructureException)):
+            message = err.messages
+        elif isinstance(err, (ResponseOkMessage, ResponseFailMessage)):
+            message = err.message
+            data = err.data
+        elif isinstance(err, ResponseError):
             message = '{}'.format(err)
-            response_status = HTTP_500_INTERNAL_SERVER_ERROR
-        if success is not None:
-            success = 200 <= response_status <= 299
-        # message = message and [{"response": message}] or []
+        else:
+            return data, '{}'.format(err), HTTP_500_INTERNAL_SERVER_ERROR
+        return data, message, err.response_status
+
+    def _handler_response(self, data, message, response_status):
+        success = 200 <= response_status <= 299
         _response = self.set_response_structure(data, success, message)
         logger.debug('Response: [{}] {}'.format(response_status, _response))
         return _response, response_status
 
+    def _stream_response(self, method, data, status,
+                         policy=VALIDATE_ALWAYS):
+        # renders iterator (generator, QuerySet) returned by handler as
+        # json array with StreamingHttpResponse, every item is validated
+        # by response_fields list item structure, custom_validation is not
+        # applied to streamed data
+        validate = None
+        if self.response_fields != {} and policy != VALIDATE_NEVER:
+            plan = self._get_plan(self.response_fields, method)
+            if plan is None or plan.item is None:
+                raise ResponseStructureException(
+                    'response data structure for streamed response should '
+                    'be a list, check for documentation or leave blank')
+            validate = plan.item
+            if rester_settings.get('SOFT_RESPONSE_VALIDATION', False):
+                validate = plan.item.soft
+        codec = rester_settings['JSON_BACKEND']
+        items = iter(data.iterator() if isinstance(data, QuerySet) else data)
+        first = next(items, _STREAM_EMPTY)
+        if first is not _STREAM_EMPTY:
+            # first item is processed before the response is started,
+            # so invalid structure could still be reported with a status
+            if policy == VALIDATE_SAMPLED:
+                # only the first item is checked, the rest are not touched
+                if validate is not None:
+                    self._response_violation(method, validate(first)[1])
+                validate = None
+            elif validate is not None:
+                first = self._stream_item_validate(first, validate)
+            first = codec.dumps(first)
+        envelope = codec.dumps(self.set_response_structure(
+            STREAM_PLACEHOLDER, 200 <= status <= 299, []))
+        prefix, suffix = envelope.split(codec.dumps(STREAM_PLACEHOLDER), 1)
+        response = StreamingHttpResponse(
+            self._stream_content(first, items, validate, prefix, suffix),
+            content_type='application/json', status=status)
+        return self._set_cors(response)
+
+    @staticmethod
+    def _stream_item_validate(item, validate):
+        value, messages = validate(item)
+        if messages:
+            raise ResponseStructureException(
+                [RESPONSE_STRUCTURE_MESSAGE, {'response': messages}],
+                HTTP_500_INTERNAL_SERVER_ERROR)
+        return value
+
+    def _stream_content(self, first, items, validate, prefix, suffix):
+        dumps = rester_settings['JSON_BACKEND'].dumps
+        chunk, size = [prefix, b'['], 0
+        if first is not _STREAM_EMPTY:
+            chunk.append(first)
+            for item in items:
+                if validate is not None:
+                    try:
+                        item = self._stream_item_validate(item, validate)
+                    except ResponseStructureException as err:
+                        # response is already started, so the only way to
+                        # report an error is to break the stream
+                        logger.error('Streamed response item is not valid: '
+                                     '{}'.format(err.messages))
+                        raise
+                item = dumps(item)
+                chunk.append(b',')
+                chunk.append(item)
+                size += len(item)
+                if size >= STREAM_CHUNK_SIZE:
+                    yield b''.join(chunk)
+                    chunk, size = [], 0
+        chunk.append(b']')
+        chunk.append(suffix)
+        yield b''.join(chunk)
+
     @staticmethod
     def set_response_structure(data=None, success=True, message=None):
-        if isinstance(data, HttpResponse):
+        if isinstance(data, HttpResponseBase):
             _response = data
         else:
             response_structure = rester_settings.get('RESPONSE_STRUCTURE', {})
@@ -335,6 +828,196 @@ class BaseAPIView(View):
         return _response
 
 
+class AsyncBaseAPIView(BaseAPIView):
+    """BaseAPIView for ASGI deployments.
+
+    Handlers may be defined with async def (sync handlers are run in
+    a thread), authentication backend is awaited with its aauthenticate()
+    method when it is available, custom_validation may be async as well.
+    """
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self._timing = start_timing()
+        if self.throttle_rates and get_store().blocking:
+            rejected = await sync_to_async(self._reject)(request)
+        else:
+            rejected = self._reject(request)
+        if rejected is not None:
+            return self._finish_response(request, rejected)
+        resp, response_status, messages = [], None, []
+        auth_before_parse = self._auth_before_parse()
+        if auth_before_parse:
+            messages = self._set_user(request,
+                                      *await self._aauthenticate(request))
+            if not messages and getattr(self._get_handler(request),
+                                        'permissions', None):
+                # request.user could be lazy and hit the database
+                rejected = await sync_to_async(self._check_permissions)(
+                    request)
+                if rejected is not None:
+                    return self._finish_response(request, rejected)
+        if not messages:
+            self.request_data, messages = self._set_request_data(request)
+            self._mark('parse')
+        if not messages:
+            if not auth_before_parse:
+                messages = self._set_user(
+                    request, *await self._aauthenticate(request))
+            try:
+                self.request_data = await self._adata_validate(
+                    request.method, self.request_data, self.request_fields,
+                    RequestStructureException, REQUEST_STRUCTURE_MESSAGE,
+                    'request'
+                )
+            except RequestStructureException as err:
+                messages = err.messages
+                response_status = err.response_status
+            self._mark('request_validation')
+            if not messages:
+                not_modified = await self._anot_modified(request, *args,
+                                                         **kwargs)
+                if not_modified is not None:
+                    return self._finish_response(request, not_modified)
+                resp, response_status = await self.try_response(
+                    self._get_handler(request), request, *args, **kwargs)
+        response = self._dispatch_response(resp, response_status, messages)
+        if self._cached is not None:
+            cache, key, lock = self._cached
+            await cache.astore(key, response, lock)
+        return self._finish_response(request, self._set_etag(request,
+                                                             response))
+
+    async def _anot_modified(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if getattr(self._get_handler(request), 'permissions', None):
+            rejected = await sync_to_async(self._check_permissions)(request)
+            if rejected is not None:
+                return rejected
+        return self._conditional_response(
+            request, *await self._aget_version(request, *args, **kwargs))
+
+    async def _aget_version(self, request, *args, **kwargs):
+        # get_etag/get_last_modified may be async, sync ones are run
+        # in a thread (they may hit the database)
+        if request.method not in ('GET', 'HEAD'):
+            return None, None
+        version = []
+        for func in (self.get_etag, self.get_last_modified):
+            if not iscoroutinefunction(func):
+                func = sync_to_async(func)
+            version.append(await func(request, *args, **kwargs))
+        return version
+
+    async def _aauthenticate(self, request):
+        batch_auth = getattr(request, 'batch_auth', None)
+        if batch_auth is not None:
+            return batch_auth
+        authenticate = getattr(self.auth, 'aauthenticate', None)
+        if authenticate is None:
+            authenticate = sync_to_async(self.auth.authenticate)
+        return await authenticate(request)
+
+    async def _adata_validate(self, method, data, fields, exception,
+                              exception_message, msg_key='validate'):
+        if fields == {}:
+            return data
+        structured_data, messages = self._structure_validate(
+            method, data, fields, exception, exception_message)
+        if not messages:
+            messages = await self._amodel_validate(method, fields,
+                                                   structured_data)
+        if not messages:
+            structured_data, messages = await self._acustom_validate(
+                structured_data)
+        return self._validation_result(structured_data, messages, exception,
+                                       exception_message, msg_key)
+
+    async def _amodel_validate(self, method, fields, structured_data):
+        plan = self._model_plan(method, fields)
+        if plan is None:
+            return []
+        return await plan.aresolve_models(structured_data)
+
+    async def _acustom_validate(self, structured_data):
+        if not iscoroutinefunction(self.custom_validation):
+            # sync custom_validation may hit the database
+            return await sync_to_async(self._custom_validate)(
+                structured_data)
+        try:
+            structured_data = await self.custom_validation(structured_data)
+            assert structured_data is not None, \
+                '.custom_validation() should return validated structured data'
+        except (AssertionError, CustomValidationException) as exc:
+            return structured_data, ['{}'.format(exc)]
+        return structured_data, []
+
+    async def try_response(self, handler, request, *args, **kwargs):
+        data = None
+        self._log_request(request)
+        try:
+            if not iscoroutinefunction(handler):
+                handler = sync_to_async(handler)
+            data = await handler(request, *args, **kwargs)
+            if isawaitable(data):
+                # sync wrappers (e.g. decorators) around async handlers
+                data = await data
+            data, response_status = self._handler_result(data)
+            self._mark('handler')
+            data = await self._aresponse_validate(request, data,
+                                                  response_status)
+        except Exception as err:
+            self._mark_error()
+            data, message, response_status = self._handler_error(
+                request, err, data)
+        else:
+            message = []
+        self._mark('response_validation')
+        return self._handler_response(data, message, response_status)
+
+    async def _aresponse_validate(self, request, data, response_status):
+        if isinstance(data, HttpResponseBase):
+            return data
+        policy = self._response_policy()
+        if isinstance(data, (Iterator, QuerySet)):
+            # iterators could hit the database, so they are not touched
+            # inside the event loop
+            response = await sync_to_async(self._stream_response)(
+                request.method, data, response_status, policy)
+            response.streaming_content = self._astream_content(
+                response.streaming_content)
+            return response
+        elif policy == VALIDATE_NEVER:
+            return data
+        elif policy == VALIDATE_SAMPLED:
+            structured_data, messages = self._response_check(request.method,
+                                                             data)
+            if not messages:
+                structured_data, messages = await self._acustom_validate(
+                    structured_data)
+            self._response_violation(request.method, messages)
+            return data
+        return await self._adata_validate(
+            request.method, data, self.response_fields,
+            ResponseStructureException, RESPONSE_STRUCTURE_MESSAGE,
+            'response'
+        )
+
+    @staticmethod
+    async def _astream_content(content):
+        next_chunk = sync_to_async(next)
+        while True:
+            chunk = await next_chunk(content, None)
+            if chunk is None:
+                break
+            yield chunk
+
+    async def options(self, request, *args, **kwargs):
+        result = await View.options(self, request, *args, **kwargs)
+        return self._set_cors(result)
+
+
 class Login(BaseAPIView):
     request_fields = {
         "POST": {
@@ -354,3 +1037,138 @@ class Logout(BaseAPIView):
     def get(self, request):
         data, status = self.auth.logout(request, self.request_data)
         return data, status
+
+
+class BatchAPIView(BaseAPIView):
+    """Runs many API requests in one.
+
+    POST body is a list of operations: {"method": "GET", "path":
+    "/api/items/?page=2", "body": {...}}. Every operation is dispatched
+    to the view of its path (BaseAPIView subclasses only) with the batch
+    request headers and user, authentication is not repeated. Operations
+    should be independent, they are run in a threads pool of max_workers.
+    Response is a list of {"status": ..., "body": ...} in the same order.
+    """
+    max_operations = 50
+    max_workers = 4
+
+    def post(self, request):
+        operations = self._operations(self.request_data)
+        if self.max_workers > 1 and len(operations) > 1:
+            with ThreadPoolExecutor(min(self.max_workers,
+                                        len(operations))) as executor:
+                results = list(executor.map(
+                    lambda operation: self._run_in_thread(request, operation),
+                    operations))
+        else:
+            results = [self._run(request, operation)
+                       for operation in operations]
+        # sub-responses are already rendered, so they are joined as is
+        return self._set_cors(HttpResponse(
+            b'[' + b','.join(results) + b']',
+            content_type='application/json'))
+
+    def _operations(self, data):
+        if not isinstance(data, list):
+            raise ResponseBadRequestMsgList(
+                'Batch request should be a list of operations')
+        if len(data) > self.max_operations:
+            raise ResponseBadRequestMsgList(
+                'Too many operations, {} allowed'.format(self.max_operations))
+        for operation in data:
+            if not (isinstance(operation, dict)
+                    and isinstance(operation.get('method'), str)
+                    and isinstance(operation.get('path'), str)):
+                raise ResponseBadRequestMsgList(
+                    'Every operation should have method and path')
+        return data
+
+    def _run_in_thread(self, request, operation):
+        try:
+            return self._run(request, operation)
+        finally:
+            # database connections are per thread, pool threads are gone
+            # after the batch
+            connections.close_all()
+
+    def _run(self, request, operation):
+        codec = rester_settings['JSON_BACKEND']
+        path, _, query = operation['path'].partition('?')
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return self._result(HTTP_404_NOT_FOUND, codec.dumps(
+                self.set_response_structure(None, False, ['Not found'])))
+        view_class = getattr(match.func, 'view_class', None)
+        if (view_class is None or not issubclass(view_class, BaseAPIView)
+                or issubclass(view_class, BatchAPIView)):
+            return self._result(HTTP_400_BAD_REQUEST, codec.dumps(
+                self.set_response_structure(
+                    None, False, ['Path is not an API view'])))
+        sub_request = self._sub_request(
+            request, operation['method'].upper(), path, query,
+            operation.get('body'))
+        sub_request.resolver_match = match
+        try:
+            if view_class.view_is_async:
+                response = async_to_sync(match.func)(
+                    sub_request, *match.args, **match.kwargs)
+            else:
+                response = match.func(sub_request, *match.args,
+                                      **match.kwargs)
+            return self._result(response.status_code,
+                                self._content(response))
+        except Exception as err:
+            # failed operation does not fail the whole batch
+            logger.exception('Error in batch operation [{} {}]'.format(
+                sub_request.method, path))
+            return self._result(HTTP_500_INTERNAL_SERVER_ERROR, codec.dumps(
+                self.set_response_structure(None, False, ['{}'.format(err)])))
+
+    @staticmethod
+    def _sub_request(request, method, path, query, body):
+        content = b''
+        if body is not None:
+            content = rester_settings['JSON_BACKEND'].dumps(body)
+        sub_request = HttpRequest()
+        sub_request.method = method
+        sub_request.path = sub_request.path_info = path
+        sub_request.META = dict(
+            request.META, REQUEST_METHOD=method, PATH_INFO=path,
+            QUERY_STRING=query, CONTENT_TYPE='application/json',
+            CONTENT_LENGTH=str(len(content)))
+        sub_request.GET = QueryDict(query)
+        sub_request.COOKIES = request.COOKIES
+        sub_request.content_type = 'application/json'
+        sub_request.content_params = {}
+        sub_request._body = content
+        sub_request._stream = BytesIO(content)
+        if hasattr(request, 'user'):
+            sub_request.user = request.user
+        sub_request.batch_auth = (None, [])
+        return sub_request
+
+    @staticmethod
+    def _content(response):
+        if not response.streaming:
+            content = response.content
+        elif getattr(response, 'is_async', False):
+            content = async_to_sync(_join_chunks)(response.streaming_content)
+        else:
+            content = b''.join(response.streaming_content)
+        if not content:
+            return b'null'
+        if not response.get('Content-Type', '').startswith(
+                'application/json'):
+            content = rester_settings['JSON_BACKEND'].dumps(
+                content.decode('utf-8', 'replace'))
+        return content
+
+    @staticmethod
+    def _result(status, content):
+        return b'{"status": ' + str(status).encode() + b', "body": ' + \
+            content + b'}'
+
+
+async def _join_chunks(chunks):
+    return b''.join([chunk async for chunk in chunks])
@@ -1,2 +1,1191 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from unittest import mock
 
+import fakeredis
+import jwt
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import ImproperlyConfigured
+from django.test import (AsyncRequestFactory, RequestFactory,
+                         SimpleTestCase, TestCase, override_settings)
+from django.urls import path
+from django_rediser import RedisStorage
+
+from django_rester import codec, fields, throttling
+from django_rester.cache import LRUCache
+from django_rester.client import (AsyncResterClient, CircuitBreaker,
+                                  ResterClient, ResterPool, RetryPolicy)
+from django_rester.codec import get_codec
+from django_rester.decorators import cached_response, permissions
+from django_rester.exceptions import (CircuitOpenError,
+                                      CustomValidationException,
+                                      ResterException)
+from django_rester.instrumentation import metrics_view, request_timed
+from django_rester.permission import (BasePermission, IsAdmin,
+                                      IsAuthenticated)
+from django_rester.rester_jwt import revocation
+from django_rester.rester_jwt.auth import Auth, BaseAuth
+from django_rester.schema import ValidationPlan
+from django_rester.settings import rester_settings
+from django_rester.stream import JSONArrayParser
+from django_rester.views import (AsyncBaseAPIView, BaseAPIView, BatchAPIView,
+                                 response_violations)
+
+
+def post_json(view, data, path='/', **extra):
+    request = RequestFactory().post(path, data=json.dumps(data),
+                                    content_type='application/json', **extra)
+    return view.as_view()(request)
+
+
+class ValidationPlanTests(SimpleTestCase):
+
+    def test_instance_fields_are_not_cached(self):
+        class InstanceFieldsView(BaseAPIView):
+            request_fields = {'POST': {'a': fields.Int(required=True)}}
+
+            def __init__(self, **kwargs):
+                super().__init__(**kwargs)
+                self.response_fields = {'POST': {'b': fields.Int()}}
+
+            def post(self, request):
+                return {'b': '2'}
+
+        for _ in range(3):
+            response = post_json(InstanceFieldsView, {'a': '1'})
+            self.assertEqual(json.loads(response.content)['data'], {'b': 2})
+        # only class level request_fields plan is cached
+        self.assertEqual(len(InstanceFieldsView._validation_plans), 1)
+
+    def test_class_fields_replaced(self):
+        class ReplacedFieldsView(BaseAPIView):
+            request_fields = {'POST': {'a': fields.Int(required=True)}}
+
+            def post(self, request):
+                return self.request_data
+
+        self.assertEqual(json.loads(post_json(
+            ReplacedFieldsView, {'a': '1'}).content)['data'], {'a': 1})
+        ReplacedFieldsView.request_fields = {'POST': {'a': fields.String()}}
+        self.assertEqual(json.loads(post_json(
+            ReplacedFieldsView, {'a': '1'}).content)['data'], {'a': '1'})
+
+    def test_check_json_field(self):
+        view = BaseAPIView()
+        structure = {'x': fields.Int(), 'items': [{'id': fields.Int()}]}
+        self.assertEqual(
+            view._check_json_field({'x': '3', 'items': [{'id': '1'}]},
+                                   structure),
+            ({'x': 3, 'items': [{'id': 1}]}, []))
+        value, messages = view._check_json_field({'x': 'q'}, structure)
+        self.assertTrue(messages)
+
+
+class JSONFieldTests(SimpleTestCase):
+
+    def test_validate_is_stateless(self):
+        field = fields.Int(required=True, default=3)
+        state = dict(vars(field))
+        self.assertEqual(field.validate('a', '1'), (1, ()))
+        value, messages = field.validate('a', 'x')
+        self.assertIsNone(value)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(field.validate('a', None),
+                         (None, ['`a` value is required']))
+        self.assertEqual(vars(field), state)
+        self.assertEqual(fields.Int(default=3).validate('a', None), (3, ()))
+        self.assertEqual(fields.String(blank=False).validate('s', ''),
+                         (None, ['`s` value blank is not allowed']))
+
+
+class CodecTests(SimpleTestCase):
+
+    def test_named_backends(self):
+        self.assertIsInstance(get_codec('json'), codec.JSONCodec)
+        self.assertEqual(get_codec('json').dumps({'a': 1}), b'{"a": 1}')
+        self.assertEqual(get_codec(codec.JSONCodec).loads(b'[1]'), [1])
+
+    def test_missing_library_warns(self):
+        with mock.patch.dict(codec.CODECS,
+                             {'orjson': (codec.OrjsonCodec, None)}):
+            with self.assertLogs('django_rester', 'WARNING'):
+                self.assertIsInstance(get_codec('orjson'), codec.JSONCodec)
+
+    def test_wrong_path_raises(self):
+        for backend in ('json_codecs.Missing', 'django_rester.codec.Missing',
+                        'orjsn', 42):
+            with self.assertRaises(ImproperlyConfigured):
+                get_codec(backend)
+
+    def test_import_path(self):
+        self.assertIsInstance(get_codec('django_rester.codec.UjsonCodec'),
+                              codec.UjsonCodec)
+
+
+class QueryDataTests(SimpleTestCase):
+
+    def test_query_fields(self):
+        class QueryView(BaseAPIView):
+            request_fields = {'GET': {'ids': [fields.Int()],
+                                      'q': fields.String(),
+                                      'n': fields.Int(default=1)}}
+
+            def get(self, request):
+                return self.request_data
+
+        response = QueryView.as_view()(
+            RequestFactory().get('/', {'ids': ['1', '2'], 'q': ['a', 'b'],
+                                       'extra': '1'}))
+        self.assertEqual(json.loads(response.content)['data'],
+                         {'ids': [1, 2], 'q': 'b', 'n': 1})
+        response = QueryView.as_view()(RequestFactory().get('/?ids=x'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_without_fields(self):
+        class QueryView(BaseAPIView):
+            def get(self, request):
+                return self.request_data
+
+        response = QueryView.as_view()(RequestFactory().get('/?a=1&a=2&b=c'))
+        self.assertEqual(json.loads(response.content)['data'],
+                         {'a': '2', 'b': 'c'})
+
+
+class StreamedItemsView(BaseAPIView):
+    response_fields = {'GET': [{'id': fields.Int(required=True)}]}
+
+    def get(self, request):
+        if request.GET.get('users'):
+            return User.objects.order_by('id').values('id')
+        return ({'id': str(i)} for i in range(int(request.GET['n'])))
+
+
+def streamed(response):
+    return json.loads(b''.join(response.streaming_content))
+
+
+class StreamedResponseTests(TestCase):
+
+    def test_generator(self):
+        response = StreamedItemsView.as_view()(RequestFactory().get('/?n=3'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(streamed(response), {
+            'success': True, 'message': [],
+            'data': [{'id': 0}, {'id': 1}, {'id': 2}]})
+        response = StreamedItemsView.as_view()(RequestFactory().get('/?n=0'))
+        self.assertEqual(streamed(response)['data'], [])
+
+    def test_queryset(self):
+        users = [User.objects.create_user(name) for name in ('a', 'b')]
+        response = StreamedItemsView.as_view()(
+            RequestFactory().get('/?users=1'))
+        self.assertEqual(streamed(response)['data'],
+                         [{'id': user.id} for user in users])
+
+    def test_invalid_first_item(self):
+        class InvalidItemsView(StreamedItemsView):
+            def get(self, request):
+                return iter([{'x': 1}, {'id': 2}])
+
+        with self.assertLogs('django_rester', 'ERROR'):
+            response = InvalidItemsView.as_view()(RequestFactory().get('/'))
+        self.assertEqual(response.status_code, 500)
+
+
+class StreamItemsView(BaseAPIView):
+    stream_request = True
+    request_fields = {'POST': [{'id': fields.Int(required=True)}]}
+
+    def post(self, request):
+        return {'ids': [item['id'] for item in self.request_data]}
+
+
+class StreamRequestTests(SimpleTestCase):
+
+    def test_items_are_validated(self):
+        response = post_json(StreamItemsView, [{'id': '1'}, {'id': 2}])
+        self.assertEqual(json.loads(response.content)['data'],
+                         {'ids': [1, 2]})
+        response = post_json(StreamItemsView, [{'id': 1}, {'id': 'x'}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_body(self):
+        request = RequestFactory().post('/', data='[{"id": 1}, {"id"',
+                                        content_type='application/json')
+        response = StreamItemsView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=1000)
+    def test_body_size_limit(self):
+        response = post_json(StreamItemsView,
+                             [{'id': i} for i in range(10000)])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Request body is too large',
+                      response.content.decode())
+
+    def test_item_size_limit(self):
+        class SmallItemsView(StreamItemsView):
+            stream_max_item_size = 100
+
+        response = post_json(SmallItemsView, [{'id': 1, 'x': 'a' * 200}])
+        self.assertEqual(response.status_code, 400)
+        response = post_json(SmallItemsView, [{'id': 1, 'x': 'a' * 50}])
+        self.assertEqual(response.status_code, 200)
+
+
+class JSONArrayParserTests(SimpleTestCase):
+    body = (b'[1, 2.5, "a\\"b\\u00e9", {"k": [1, {"z": null}]}, [], true, '
+            b'null, -12e3]')
+    items = [1, 2.5, 'a"b\xe9', {'k': [1, {'z': None}]}, [], True, None,
+             -12000.0]
+
+    def test_any_chunks(self):
+        for size in (1, 2, 3, 7, 100):
+            parser, items = JSONArrayParser(), []
+            for pos in range(0, len(self.body), size):
+                items += parser.feed(self.body[pos:pos + size])
+            self.assertEqual(items + parser.close(), self.items)
+
+    def test_envelope_key(self):
+        parser = JSONArrayParser(key='data')
+        items = parser.feed(b'{"success": true, "data": [1, 2], "n": 2}')
+        self.assertEqual(items + parser.close(), [1, 2])
+        self.assertEqual(parser.envelope, {'success': True, 'n': 2})
+
+    def test_errors(self):
+        for body in (b'{"a": 1}', b'[1 2]', b'[1,'):
+            parser = JSONArrayParser()
+            with self.assertRaises(ValueError):
+                parser.feed(body)
+                parser.close()
+
+    def test_big_item_is_not_decoded_per_chunk(self):
+        parser = JSONArrayParser()
+        body = json.dumps([{'x': 'a' * 100000}]).encode()
+        with mock.patch.object(parser, '_raw_decode',
+                               wraps=parser._raw_decode) as raw_decode:
+            for pos in range(0, len(body), 1000):
+                parser.feed(body[pos:pos + 1000])
+            self.assertEqual(len(parser.close()), 1)
+        # decoding is retried when the buffer is doubled, not per chunk
+        self.assertLess(raw_decode.call_count, 15)
+
+
+class AsyncItemsView(AsyncBaseAPIView):
+    request_fields = {'POST': {'id': fields.Int(required=True)},
+                      'GET': {'n': fields.Int(default=3)}}
+    response_fields = {'POST': {'id': fields.Int()},
+                       'GET': [{'id': fields.Int()}]}
+
+    async def post(self, request):
+        await asyncio.sleep(0)
+        return {'id': str(self.request_data['id'])}
+
+    async def get(self, request):
+        return ({'id': i} for i in range(self.request_data['n']))
+
+
+class AsyncViewTests(TestCase):
+
+    async def test_post(self):
+        view = AsyncItemsView.as_view()
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        responses = await asyncio.gather(*[view(AsyncRequestFactory().post(
+            '/', json.dumps({'id': i}), content_type='application/json'))
+            for i in range(3)])
+        self.assertEqual([json.loads(response.content)['data']
+                          for response in responses],
+                         [{'id': 0}, {'id': 1}, {'id': 2}])
+        response = await view(AsyncRequestFactory().post(
+            '/', '{}', content_type='application/json'))
+        self.assertEqual(response.status_code, 400)
+
+    async def test_streamed_response(self):
+        response = await AsyncItemsView.as_view()(AsyncRequestFactory().get(
+            '/'))
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in
+                            response.streaming_content])
+        self.assertEqual(json.loads(content)['data'],
+                         [{'id': 0}, {'id': 1}, {'id': 2}])
+
+    async def test_sync_custom_validation(self):
+        class CheckedView(AsyncItemsView):
+            def custom_validation(self, data):
+                # the ORM is not allowed in the event loop
+                if User.objects.filter(pk=data['id']).exists():
+                    raise CustomValidationException('taken')
+                return data
+
+        response = await CheckedView.as_view()(AsyncRequestFactory().post(
+            '/', json.dumps({'id': 1}), content_type='application/json'))
+        self.assertEqual(response.status_code, 200)
+
+
+class JWTCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='pw')
+        self.auth = Auth()
+        token = jwt.encode(self.auth._set_payload(self.user),
+                           self.auth.settings['SECRET'],
+                           algorithm=self.auth.settings['ALGORITHM'])
+        self.request = RequestFactory().get(
+            '/', HTTP_AUTHORIZATION='jwt ' + token)
+        BaseAuth._token_cache.clear()
+        self.addCleanup(BaseAuth._token_cache.clear)
+
+    def test_user_cache(self):
+        with mock.patch.object(BaseAuth, '_user_cache', LRUCache(10, 60)):
+            with self.assertNumQueries(1):
+                for _ in range(3):
+                    user, messages = self.auth.authenticate(self.request)
+                    self.assertEqual(user, self.user)
+            BaseAuth.invalidate_user(self.user)
+            with self.assertNumQueries(1):
+                user, messages = self.auth.authenticate(self.request)
+            # requests don't share the cached instance
+            user.first_name = 'changed'
+            user, messages = self.auth.authenticate(self.request)
+            self.assertEqual(user.first_name, '')
+
+    def test_token_cache(self):
+        with mock.patch.object(Auth, '_decode_token',
+                               wraps=self.auth._decode_token) as decode:
+            for _ in range(3):
+                self.assertEqual(self.auth.authenticate(self.request)[0],
+                                 self.user)
+            self.assertEqual(decode.call_count, 1)
+            self.assertEqual(BaseAuth.token_cache_stats()['hits'], 2)
+            self.auth.logout(self.request, {})
+            self.auth.authenticate(self.request)
+            self.assertEqual(decode.call_count, 2)
+
+    def test_wrong_token(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION='jwt broken')
+        user, messages = self.auth.authenticate(request)
+        self.assertIsNone(user)
+        self.assertTrue(messages)
+        self.assertEqual(len(BaseAuth._token_cache), 0)
+
+
+def fake_redis_storage():
+    storage = RedisStorage()
+    storage._db = fakeredis.FakeStrictRedis()
+    return storage
+
+
+class DenylistTests(SimpleTestCase):
+
+    def test_revoked_until_expired(self):
+        denylist = revocation.TokenDenylist(fake_redis_storage())
+        denylist._pid = revocation.os.getpid()  # no background sync
+        now = time.time()
+        denylist.revoke(b'\x01', now + 60)
+        denylist.revoke(b'\x02', now - 1)
+        self.assertTrue(denylist.is_revoked(b'\x01'))
+        self.assertFalse(denylist.is_revoked(b'\x02'))
+        self.assertFalse(denylist.is_revoked(b'\x03'))
+
+    def test_clock_skew(self):
+        storage = fake_redis_storage()
+        writer = revocation.TokenDenylist(storage)
+        reader = revocation.TokenDenylist(storage)
+        exp = time.time() + 60
+        reader.sync()
+        # the revoking host clock is behind the reader one
+        skewed = mock.Mock(time=mock.Mock(return_value=time.time() - 30))
+        with mock.patch.object(revocation, 'time', skewed):
+            writer.revoke(b'\x01', exp)
+        reader.sync()
+        self.assertIn(b'\x01', reader._revoked)
+        writer.revoke(b'\x02', exp)
+        reader.sync()
+        self.assertIn(b'\x02', reader._revoked)
+
+
+class ClientHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    items = 1000
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self, body=None):
+        path = self.path.split('?', 1)[0]
+        if path == '/slow':
+            time.sleep(0.2)
+        elif path == '/flaky':
+            # every third request succeeds
+            self.server.hits += 1
+            if self.server.hits % 3:
+                return self.send_json(503, {})
+        elif path == '/down':
+            return self.send_json(500, {})
+        elif path == '/items':
+            return self.send_json(200, {
+                'success': True,
+                'data': [{'id': i} for i in range(self.items)]})
+        self.send_json(200, {'path': self.path, 'body': body})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.do_GET(self.rfile.read(length).decode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+class ClientServer(ThreadingHTTPServer):
+    daemon_threads = True
+    hits = 0
+
+    def handle_error(self, request, client_address):
+        # clients of timeout tests disconnect before the response
+        pass
+
+
+class ClientTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ClientServer(('127.0.0.1', 0), ClientHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = 'http://127.0.0.1:{}/'.format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_client(self):
+        client = ResterClient(self.base_url)
+        self.addCleanup(client.close)
+        response = client.get('echo', {'x': 2})
+        self.assertEqual(response['response_code'], 200)
+        self.assertEqual(response['data']['path'], '/echo?x=2')
+        response = client.post('echo', json={'a': 1})
+        self.assertEqual(json.loads(response['data']['body']), {'a': 1})
+        # the previous body is not sent again
+        response = client.post('echo')
+        self.assertEqual(response['data']['body'], '')
+
+    def test_pool(self):
+        pool = ResterPool(self.base_url, max_connections=5)
+        self.addCleanup(pool.close)
+        started = time.monotonic()
+        responses = pool.get_many(['slow?n={}'.format(i) for i in range(10)])
+        # 10 requests of 0.2 seconds over 5 connections
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual([response['data']['path'] for response in responses],
+                         ['/slow?n={}'.format(i) for i in range(10)])
+        responses = pool.post_many([('echo', {'a': 1}), ('echo', None)])
+        self.assertEqual([response['data']['body'] for response in responses],
+                         ['{"a": 1}', ''])
+        future = pool.submit('PUT', 'echo')
+        pool.perform()
+        self.assertIsInstance(future.exception(), ResterException)
+
+    def test_pool_connection_error(self):
+        pool = ResterPool('http://127.0.0.1:1/')
+        self.addCleanup(pool.close)
+        response, = pool.get_many(['echo'])
+        self.assertEqual(response['response_code'], 0)
+        self.assertTrue(response['message'])
+
+    async def test_async_client(self):
+        async with AsyncResterClient(self.base_url,
+                                     max_connections=4) as client:
+            responses = await client.get_many(
+                ['slow?n={}'.format(i) for i in range(4)])
+            self.assertEqual([response['response_code']
+                              for response in responses], [200] * 4)
+            response = await client.post('echo', json={'a': 1})
+            self.assertEqual(response['data']['body'], '{"a": 1}')
+            response = await client.get('slow', timeout=0.05)
+            self.assertEqual(response['response_code'], 0)
+
+    def test_retry(self):
+        self.server.hits = 0
+        client = ResterClient(self.base_url,
+                              retry=RetryPolicy(backoff=0.01))
+        self.addCleanup(client.close)
+        self.assertEqual(client.get('flaky')['response_code'], 200)
+        self.assertEqual(self.server.hits, 3)
+        # not idempotent method is not retried
+        self.server.hits = 0
+        self.assertEqual(client.post('flaky')['response_code'], 503)
+        self.assertEqual(self.server.hits, 1)
+
+    def test_retry_budget(self):
+        policy = RetryPolicy(retries=3, budget=0.5, min_retries=1)
+        self.assertTrue(policy.should_retry('GET', 503, 0))
+        self.assertFalse(policy.should_retry('GET', 503, 1))
+        policy.request()
+        policy.request()
+        self.assertTrue(policy.should_retry('GET', 0, 1))
+        self.assertFalse(policy.should_retry('GET', 404, 0))
+        self.assertFalse(policy.should_retry('POST', 503, 0))
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(threshold=2, reset_timeout=0.2)
+        client = ResterClient(self.base_url, breaker=breaker)
+        self.addCleanup(client.close)
+        host = '127.0.0.1:{}'.format(self.server.server_port)
+        with self.assertLogs('django_rester', 'WARNING'):
+            for _ in range(2):
+                self.assertEqual(client.get('down')['response_code'], 500)
+        self.assertTrue(breaker.is_open(host))
+        with self.assertRaises(CircuitOpenError):
+            client.get('echo')
+        time.sleep(0.25)
+        self.assertEqual(client.get('echo')['response_code'], 200)
+        self.assertFalse(breaker.is_open(host))
+
+    def test_stream(self):
+        client = ResterClient(self.base_url)
+        self.addCleanup(client.close)
+        items = list(client.stream('items', items=True, key='data'))
+        self.assertEqual(items, [{'id': i}
+                                 for i in range(ClientHandler.items)])
+        body = b''.join(client.stream('items'))
+        self.assertEqual(len(json.loads(body)['data']), ClientHandler.items)
+        # the client is usable after streaming
+        self.assertEqual(client.get('echo')['response_code'], 200)
+
+    def test_download(self):
+        client = ResterClient(self.base_url)
+        self.addCleanup(client.close)
+        target = BytesIO()
+        response = client.download('items', target)
+        self.assertEqual(response['response_code'], 200)
+        self.assertIsNone(response['data'])
+        self.assertEqual(len(json.loads(target.getvalue())['data']),
+                         ClientHandler.items)
+
+
+class InstrumentationTests(SimpleTestCase):
+
+    @mock.patch.dict(rester_settings, {'INSTRUMENTATION': True})
+    def test_timing(self):
+        class TimedView(BaseAPIView):
+            def get(self, request):
+                return {}
+
+        timings = []
+
+        def receiver(sender, timing, **kwargs):
+            timings.append((sender, sorted(timing.phases)))
+
+        request_timed.connect(receiver)
+        self.addCleanup(request_timed.disconnect, receiver)
+        response = TimedView.as_view()(RequestFactory().get('/'))
+        phases = [item.split(';')[0]
+                  for item in response['Server-Timing'].split(', ')]
+        self.assertEqual(phases, ['parse', 'auth', 'request_validation',
+                                  'handler', 'response_validation',
+                                  'serialization', 'total'])
+        self.assertEqual(timings, [(TimedView, sorted(phases[:-1]))])
+        self.assertIn('view="TimedView",method="GET",phase="total"',
+                      metrics_view(None).content.decode())
+
+    def test_disabled(self):
+        response = StreamItemsView.as_view()(RequestFactory().get('/'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class BenchmarkTests(SimpleTestCase):
+
+    def test_benchmarks_run(self):
+        # every benchmark is run once
+        demo_dir = os.path.dirname(os.path.dirname(os.path.abspath(
+            __file__)))
+        for name in ('bench_validation', 'bench_auth', 'bench_client'):
+            result = subprocess.run(
+                [sys.executable, os.path.join('benchmarks', name + '.py'),
+                 '--debug-single-value', '--quiet'],
+                cwd=demo_dir, stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.assertEqual(result.returncode, 0, result.stdout.decode())
+            self.assertIn(b'ops/s', result.stdout)
+
+
+class ValidatedView(BaseAPIView):
+    response_fields = {'GET': {'id': fields.Int(required=True)}}
+
+    def get(self, request):
+        return {'idx': 1}
+
+
+class ResponseValidationTests(SimpleTestCase):
+
+    def get(self, view=ValidatedView):
+        return view.as_view()(RequestFactory().get('/'))
+
+    def test_policies(self):
+        with mock.patch.dict(rester_settings,
+                             {'RESPONSE_VALIDATION': 'always'}):
+            with self.assertLogs('django_rester', 'ERROR'):
+                self.assertEqual(self.get().status_code, 500)
+        with mock.patch.dict(rester_settings,
+                             {'RESPONSE_VALIDATION': 'never'}):
+            self.assertEqual(json.loads(self.get().content)['data'],
+                             {'idx': 1})
+        with mock.patch.dict(rester_settings,
+                             {'RESPONSE_VALIDATION': 'debug'}):
+            self.assertEqual(self.get().status_code, 200)
+            with override_settings(DEBUG=True), \
+                    self.assertLogs('django_rester', 'ERROR'):
+                self.assertEqual(self.get().status_code, 500)
+
+    def test_sampled(self):
+        class SampledView(ValidatedView):
+            response_validation = 'sampled'
+            response_validation_rate = 100
+
+        key = ('SampledView', 'GET')
+        count = response_violations[key]
+        with self.assertLogs('django_rester', 'WARNING'):
+            response = self.get(SampledView)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_violations[key], count + 1)
+        SampledView.response_validation_rate = 0
+        self.assertEqual(self.get(SampledView).status_code, 200)
+        self.assertEqual(response_violations[key], count + 1)
+
+    def test_sampled_stream_without_response_fields(self):
+        class SampledView(BaseAPIView):
+            response_validation = 'sampled'
+            response_validation_rate = 100
+
+            def get(self, request):
+                return iter([{'id': 1}, {'id': 2}])
+
+        response = SampledView.as_view()(RequestFactory().get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content))['data'],
+            [{'id': 1}, {'id': 2}])
+
+
+class SoftValidationTests(SimpleTestCase):
+    structure = {'items': [{'id': fields.Int(required=True)}],
+                 'total': fields.Int()}
+
+    def test_valid_data_is_not_copied(self):
+        data = {'items': [{'id': 1, 'extra': {'a': 1}}], 'total': 1,
+                'meta': 'm'}
+        value, messages = ValidationPlan(self.structure).soft(data)
+        self.assertIs(value, data)
+        self.assertFalse(messages)
+
+    def test_values_are_converted(self):
+        data = {'items': [{'id': '1', 'extra': 1}], 'total': '2', 'meta': 'm'}
+        value, messages = ValidationPlan(self.structure).soft(data)
+        self.assertEqual(value, {'items': [{'id': 1, 'extra': 1}],
+                                 'total': 2, 'meta': 'm'})
+        self.assertEqual(data['total'], '2')
+        value, messages = ValidationPlan(self.structure).soft(
+            {'items': [{}]})
+        self.assertTrue(messages)
+
+    def test_missing_keys(self):
+        structure = {'name': fields.String(), 'active': fields.Bool(),
+                     'n': fields.Int(default=3)}
+        value, messages = ValidationPlan(structure).soft({'a': 1})
+        self.assertEqual(value, {'a': 1, 'n': 3})
+        self.assertFalse(messages)
+
+    @mock.patch.dict(rester_settings, {'SOFT_RESPONSE_VALIDATION': True})
+    def test_view(self):
+        class SoftView(BaseAPIView):
+            response_fields = {'GET': {'id': fields.Int()}}
+
+            def get(self, request):
+                return {'id': '1', 'extra': [1]}
+
+        response = SoftView.as_view()(RequestFactory().get('/'))
+        self.assertEqual(json.loads(response.content)['data'],
+                         {'id': 1, 'extra': [1]})
+
+
+class ModelFieldsView(BaseAPIView):
+    request_fields = {'POST': {
+        'owner': fields.Int(model='auth.User', attach=True),
+        'items': [{'user': fields.Int(required=True, model='auth.User'),
+                   'q': fields.Int()}],
+        'names': [fields.String(model=User, field='username')],
+    }}
+
+    def post(self, request):
+        return {'owner': self.request_data['owner'].username}
+
+
+class ModelFieldsTests(TestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user(name)
+                      for name in ('a', 'b', 'c')]
+        self.body = {'owner': self.users[0].id,
+                     'items': [{'user': self.users[i % 3].id, 'q': i}
+                               for i in range(50)],
+                     'names': ['a', 'c']}
+
+    def test_batch_queries(self):
+        # one query per model field
+        with self.assertNumQueries(2):
+            response = post_json(ModelFieldsView, self.body)
+        self.assertEqual(json.loads(response.content)['data'],
+                         {'owner': 'a'})
+
+    def test_missing_objects(self):
+        self.body['items'][3]['user'] = 0
+        self.body['names'].append('zz')
+        response = post_json(ModelFieldsView, self.body)
+        self.assertEqual(response.status_code, 400)
+        content = response.content.decode()
+        self.assertIn('`user` value `0` does not exist', content)
+        self.assertIn('`names` value `zz` does not exist', content)
+
+
+class VersionedView(BaseAPIView):
+    calls = 0
+
+    def get_etag(self, request):
+        return 'v1'
+
+    def get_last_modified(self, request):
+        return datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def get(self, request):
+        type(self).calls += 1
+        return {'a': 1}
+
+
+class ConditionalGetTests(SimpleTestCase):
+
+    def setUp(self):
+        VersionedView.calls = 0
+
+    def get(self, view, **headers):
+        return view.as_view()(RequestFactory().get('/', **headers))
+
+    def test_etag(self):
+        response = self.get(VersionedView)
+        self.assertEqual(response['ETag'], '"v1"')
+        self.assertEqual(response['Last-Modified'],
+                         'Wed, 01 Jan 2020 00:00:00 GMT')
+        response = self.get(VersionedView, HTTP_IF_NONE_MATCH='"v1"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        response = self.get(
+            VersionedView,
+            HTTP_IF_MODIFIED_SINCE='Wed, 01 Jan 2020 00:00:00 GMT')
+        self.assertEqual(response.status_code, 304)
+        # the handler is not called for not modified responses
+        self.assertEqual(VersionedView.calls, 1)
+        self.assertEqual(self.get(VersionedView, HTTP_IF_NONE_MATCH='"v0"')
+                         .status_code, 200)
+
+    def test_content_etag(self):
+        class HashedView(BaseAPIView):
+            etag = True
+
+            def get(self, request):
+                return {'a': 1}
+
+        etag = self.get(HashedView)['ETag']
+        response = self.get(HashedView, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(self.get(StreamItemsView).has_header('ETag'))
+
+    def test_permissions(self):
+        class PrivateView(VersionedView):
+            @permissions(IsAuthenticated)
+            def get(self, request):
+                return {'a': 1}
+
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH='"v1"')
+        request.user = AnonymousUser()
+        response = PrivateView.as_view()(request)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_async_etag(self):
+        class AsyncVersionedView(AsyncBaseAPIView):
+            async def get_etag(self, request):
+                return 7
+
+            async def get(self, request):
+                return {'a': 1}
+
+        response = await AsyncVersionedView.as_view()(
+            AsyncRequestFactory().get('/', headers={'If-None-Match': '"7"'}))
+        self.assertEqual(response.status_code, 304)
+
+        class AsyncPrivateView(AsyncVersionedView):
+            @permissions(IsAuthenticated)
+            async def get(self, request):
+                return {'a': 1}
+
+        request = AsyncRequestFactory().get(
+            '/', headers={'If-None-Match': '"7"'})
+        request.user = AnonymousUser()
+        response = await AsyncPrivateView.as_view()(request)
+        self.assertEqual(response.status_code, 401)
+
+
+class CachedView(BaseAPIView):
+    request_fields = {'GET': {'q': fields.Int()}, 'POST': {'q': fields.Int()}}
+    calls = 0
+
+    @cached_response(ttl=5, vary_on=['Accept-Language'])
+    def get(self, request):
+        type(self).calls += 1
+        time.sleep(0.1)
+        return {'q': self.request_data.get('q')}
+
+    @cached_response()
+    def post(self, request):
+        type(self).calls += 1
+        return {}, 400
+
+
+class CachedResponseTests(SimpleTestCase):
+
+    def setUp(self):
+        CachedView.calls = 0
+        CachedView.get.response_cache.cache.clear()
+
+    def get(self, path='/?q=1', **headers):
+        return CachedView.as_view()(RequestFactory().get(path, **headers))
+
+    def test_cache(self):
+        first = self.get()
+        self.assertEqual(self.get().content, first.content)
+        self.assertEqual(CachedView.calls, 1)
+        self.assertEqual(json.loads(self.get('/?q=2').content)['data'],
+                         {'q': 2})
+        self.get('/?q=2', HTTP_ACCEPT_LANGUAGE='de')
+        self.assertEqual(CachedView.calls, 3)
+        # query params not in request_fields are a part of the key too
+        self.get('/?q=2&page=2')
+        self.assertEqual(CachedView.calls, 4)
+
+    def test_dogpile(self):
+        responses = []
+        threads = [threading.Thread(
+            target=lambda: responses.append(self.get('/?q=3').content))
+            for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(responses)), 1)
+        self.assertEqual(CachedView.calls, 1)
+
+    def test_errors_are_not_cached(self):
+        for _ in range(2):
+            response = post_json(CachedView, {'q': 1})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(CachedView.calls, 2)
+
+
+class OwnerPermission(BasePermission):
+    created = 0
+
+    def __init__(self, request):
+        super().__init__(request)
+        type(self).created += 1
+        self.check = request.user.pk == 1
+        self.message = ['not owner']
+
+
+def permission_request(**attrs):
+    request = RequestFactory().get('/')
+    request.user = mock.Mock(is_authenticated=True, is_anonymous=False,
+                             is_active=True, is_superuser=False, pk=2)
+    for name, value in attrs.items():
+        setattr(request.user, name, value)
+    return request
+
+
+class PermissionTests(SimpleTestCase):
+
+    def setUp(self):
+        OwnerPermission.created = 0
+
+    def test_compose(self):
+        request = permission_request()
+        self.assertEqual((IsAdmin | OwnerPermission).evaluate(request),
+                         (False, ['not owner']))
+        permission = IsAdmin | OwnerPermission | IsAuthenticated
+        self.assertEqual(permission.__name__,
+                         '(IsAdmin | OwnerPermission | IsAuthenticated)')
+        self.assertEqual(permission.evaluate(request), (True, ['Auth OK']))
+        permission = IsAuthenticated & (OwnerPermission | IsAdmin)
+        self.assertFalse(permission.evaluate(request)[0])
+        self.assertFalse(permission(request).check)
+        # evaluated once per request
+        self.assertEqual(OwnerPermission.created, 1)
+
+    def test_decorator(self):
+        class PermittedView:
+            @permissions(IsAuthenticated, OwnerPermission)
+            @permissions(OwnerPermission)
+            def get(self, request):
+                return 'ok'
+
+        self.assertEqual(PermittedView().get(permission_request(pk=1)), 'ok')
+        self.assertEqual(PermittedView().get(permission_request()),
+                         (['not owner'], 401))
+        self.assertEqual(
+            PermittedView().get(permission_request(is_active=False)),
+            (['Required credentials are not provided'], 401))
+        self.assertEqual(PermittedView.get.permissions,
+                         (IsAuthenticated, OwnerPermission, OwnerPermission))
+
+
+class ThrottledView(BaseAPIView):
+    throttle_rates = {'GET': '2/min'}
+
+    def get(self, request):
+        return {}
+
+
+@mock.patch.object(throttling, '_store', None)
+class ThrottleTests(TestCase):
+
+    def get(self, token=None, addr='10.0.0.1'):
+        extra = {'REMOTE_ADDR': addr}
+        if token is not None:
+            extra['HTTP_AUTHORIZATION'] = 'jwt ' + token
+        return ThrottledView.as_view()(RequestFactory().get('/', **extra))
+
+    def test_rate_limit(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.get().status_code, 200)
+        response = self.get()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self.get(addr='10.0.0.2').status_code, 200)
+
+    def test_not_verified_tokens_share_address_limit(self):
+        statuses = [self.get('junk{}'.format(i)).status_code
+                    for i in range(3)]
+        self.assertNotIn(429, statuses[:2])
+        self.assertEqual(statuses[2], 429)
+
+    def test_verified_token_key(self):
+        user = User.objects.create_user('throttled')
+        BaseAuth._token_cache.set(BaseAuth._token_digest('good'),
+                                  ({'id': user.id}, time.time() + 60))
+        self.addCleanup(BaseAuth._token_cache.clear)
+        for _ in range(2):
+            self.assertEqual(self.get().status_code, 200)
+        # verified token has its own limit
+        self.assertEqual(self.get('good').status_code, 200)
+        self.assertEqual(self.get('good').status_code, 200)
+        self.assertEqual(self.get('good').status_code, 429)
+
+    def test_verified_user_key(self):
+        user = User.objects.create_user('throttled')
+        for token in ('first', 'second'):
+            BaseAuth._token_cache.set(BaseAuth._token_digest(token),
+                                      ({'username': user.username},
+                                       time.time() + 60))
+        self.addCleanup(BaseAuth._token_cache.clear)
+        with mock.patch.object(ThrottledView, 'throttle_key', 'user'):
+            # tokens of the same user share the limit
+            self.assertEqual(self.get('first').status_code, 200)
+            self.assertEqual(self.get('second').status_code, 200)
+            self.assertEqual(self.get('first').status_code, 429)
+            self.assertEqual(self.get(addr='10.0.0.3').status_code, 200)
+
+
+class RedisWindowsTests(SimpleTestCase):
+
+    def test_shared_counters(self):
+        storage = fake_redis_storage()
+        first = throttling.RedisWindows(storage, interval=0)
+        second = throttling.RedisWindows(storage, interval=0)
+        with mock.patch.object(throttling.time, 'time', return_value=1000.0):
+            self.assertEqual([first.allow('k', 3, 60)[0] for _ in range(2)],
+                             [True, True])
+            self.assertTrue(second.allow('k', 3, 60)[0])
+            allowed, retry_after = second.allow('k', 3, 60)
+            self.assertFalse(allowed)
+            self.assertEqual(retry_after, 20)
+            self.assertTrue(second.allow('other', 3, 60)[0])
+
+    def test_redis_failure(self):
+        storage = mock.Mock(execute=mock.Mock(side_effect=ConnectionError))
+        windows = throttling.RedisWindows(storage, interval=0)
+        with self.assertLogs('django_rester', 'ERROR'):
+            self.assertEqual([windows.allow('k', 2, 60)[0]
+                              for _ in range(3)], [True, True, False])
+
+
+class EchoView(BaseAPIView):
+    max_body_size = 100
+    allowed_content_types = ['application/json']
+
+    def post(self, request):
+        return self.request_data
+
+
+class EarlyRejectionTests(SimpleTestCase):
+
+    def post(self, view, body, content_type='application/json',
+             length=True):
+        request = RequestFactory().post('/', data=body,
+                                        content_type=content_type)
+        if not length:
+            # chunked body, content length is not known
+            del request.META['CONTENT_LENGTH']
+        return view.as_view()(request)
+
+    def test_content_length(self):
+        self.assertEqual(self.post(EchoView, '{"a": 1}').status_code, 200)
+        self.assertEqual(self.post(
+            EchoView, json.dumps({'a': 'x' * 100})).status_code, 413)
+        self.assertEqual(self.post(EchoView, 'a=1', 'text/plain').status_code,
+                         415)
+
+    def test_unknown_length(self):
+        response = self.post(EchoView, '{"a": 1}', length=False)
+        self.assertEqual(json.loads(response.content)['data'], {'a': 1})
+        self.assertEqual(self.post(EchoView, json.dumps({'a': 'x' * 100}),
+                                   length=False).status_code, 413)
+        self.assertEqual(self.post(EchoView, 'a=1', 'text/plain',
+                                   length=False).status_code, 415)
+
+    def test_unknown_length_stream(self):
+        class LimitedStreamView(StreamItemsView):
+            max_body_size = 100
+
+        response = self.post(LimitedStreamView, json.dumps([{'id': 1}]),
+                             length=False)
+        self.assertEqual(json.loads(response.content)['data'], {'ids': [1]})
+        response = self.post(LimitedStreamView,
+                             json.dumps([{'id': i} for i in range(100)]),
+                             length=False)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Request body is too large', response.content.decode())
+        # no Django limit
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=None):
+            response = self.post(LimitedStreamView, json.dumps([{'id': 1}]),
+                                 length=False)
+        self.assertEqual(response.status_code, 200)
+
+
+class AuthBeforeParseTests(SimpleTestCase):
+
+    def test_not_authenticated(self):
+        class ProtectedView(BaseAPIView):
+            auth_before_parse = True
+
+            @permissions(IsAuthenticated)
+            def post(self, request):
+                return {}
+
+        request = RequestFactory().post('/', data='{bad',
+                                        content_type='application/json')
+        request.user = AnonymousUser()
+        with mock.patch.object(BaseAPIView, '_set_request_data',
+                               wraps=BaseAPIView._set_request_data) as parse:
+            response = ProtectedView.as_view()(request)
+        self.assertEqual(response.status_code, 401)
+        parse.assert_not_called()
+
+
+class ItemView(BaseAPIView):
+    def get(self, request, pk):
+        return {'id': pk, 'q': request.GET.get('q')}
+
+    def post(self, request, pk):
+        return self.request_data, 201
+
+
+class BrokenEtagView(BaseAPIView):
+    def get_etag(self, request, *args, **kwargs):
+        raise RuntimeError('etag failed')
+
+    def get(self, request):
+        return {}
+
+
+urlpatterns = [
+    path('items/<int:pk>/', ItemView.as_view()),
+    path('broken/', BrokenEtagView.as_view()),
+    path('async/', AsyncItemsView.as_view()),
+    path('batch/', BatchAPIView.as_view()),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class BatchTests(SimpleTestCase):
+    operations = [
+        {'method': 'GET', 'path': '/items/1/?q=a'},
+        {'method': 'GET', 'path': '/broken/'},
+        {'method': 'post', 'path': '/items/2/', 'body': {'x': 1}},
+        {'method': 'GET', 'path': '/missing/'},
+        {'method': 'GET', 'path': '/batch/'},
+    ]
+
+    def batch(self, view, operations):
+        response = post_json(view, operations)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_operations(self):
+        for max_workers in (1, 4):
+            view = type('Batch', (BatchAPIView,),
+                        {'max_workers': max_workers})
+            with self.assertLogs('django_rester', 'ERROR'):
+                results = self.batch(view, self.operations)
+            self.assertEqual([result['status'] for result in results],
+                             [200, 500, 201, 404, 400])
+            self.assertEqual(results[0]['body']['data'],
+                             {'id': 1, 'q': 'a'})
+            self.assertIn('etag failed', results[1]['body']['message'])
+            self.assertEqual(results[2]['body']['data'], {'x': 1})
+
+    def test_bad_operations(self):
+        class SmallBatchView(BatchAPIView):
+            max_operations = 1
+
+        with self.assertLogs('django_rester', 'ERROR'):
+            response = post_json(BatchAPIView, [{'path': '/items/1/'}])
+            self.assertEqual(response.status_code, 400)
+            response = post_json(SmallBatchView, self.operations[:2])
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncBatchTests(SimpleTestCase):
+
+    def test_async_view_operation(self):
+        response = post_json(BatchAPIView, [
+            {'method': 'GET', 'path': '/async/'},
+            {'method': 'GET', 'path': '/items/3/'}])
+        self.assertEqual([item['body']['data']
+                          for item in json.loads(response.content)],
+                         [[{'id': 0}, {'id': 1}, {'id': 2}],
+                          {'id': 3, 'q': None}])
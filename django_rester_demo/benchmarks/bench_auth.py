@@ -0,0 +1,67 @@
+"""JWT authentication benchmarks, redis is emulated with fakeredis.
+
+    python benchmarks/bench_auth.py [-o result.json] [--tracemalloc]
+"""
+import time
+import warnings
+
+import fakeredis
+import jwt
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import RequestFactory
+
+from common import get_runner, report
+from django_rester.cache import LRUCache
+from django_rester.rester_jwt import auth as rester_auth
+from django_rester.rester_jwt.revocation import TokenDenylist
+
+# demo project secret is short
+warnings.filterwarnings('ignore', message='The HMAC key')
+
+
+def authenticate(auth, request):
+    user, messages = auth.authenticate(request)
+    assert user is not None, messages
+    return user
+
+
+def auth_backend(use_redis=False, denylist=False, user_cache=False):
+    # separate Auth class per case, so module-level caches are not shared
+    attrs = {'settings': dict(rester_auth.BaseAuth.settings,
+                              USE_REDIS=use_redis),
+             '_token_cache': LRUCache(),
+             '_user_cache': LRUCache(ttl=60) if user_cache else None}
+    if use_redis:
+        storage = rester_auth.RedisStorage()
+        storage._db = fakeredis.FakeStrictRedis()
+        attrs['_rs'] = storage
+        attrs['_denylist'] = TokenDenylist(storage) if denylist else None
+    return type('BenchAuth', (rester_auth.Auth,), attrs)()
+
+
+def main():
+    runner = get_runner()
+    call_command('migrate', verbosity=0)
+    user = get_user_model().objects.create_user('bench', password='bench')
+    settings = rester_auth.BaseAuth.settings
+    payload = {item: getattr(user, item) for item in settings['PAYLOAD_LIST']}
+    payload['exp'] = time.time() + 60 * 60
+    token = jwt.encode(payload, settings['SECRET'],
+                       algorithm=settings['ALGORITHM'])
+    header = '{} {}'.format(settings['AUTH_HEADER_PREFIX'], token)
+    request = RequestFactory().get('/', **{settings['AUTH_HEADER']: header})
+    allowlist = auth_backend(use_redis=True)
+    allowlist._push_token(token)
+    report(runner, [
+        ('jwt_auth', authenticate, auth_backend(), request),
+        ('jwt_auth_user_cache', authenticate, auth_backend(user_cache=True),
+         request),
+        ('jwt_auth_redis_allowlist', authenticate, allowlist, request),
+        ('jwt_auth_redis_denylist', authenticate,
+         auth_backend(use_redis=True, denylist=True), request),
+    ])
+
+
+if __name__ == '__main__':
+    main()
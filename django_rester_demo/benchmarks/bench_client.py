@@ -0,0 +1,77 @@
+"""ResterClient benchmarks against a local keep-alive HTTP server.
+
+    python benchmarks/bench_client.py [-o result.json] [--tracemalloc]
+"""
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from common import get_runner, report
+from django_rester.client import ResterClient, ResterPool
+
+BATCH = 20
+BODY = json.dumps({'success': True, 'message': [],
+                   'data': [{'id': i, 'title': 'title'} for i in range(100)]
+                   }).encode('utf-8')
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:{}/'.format(server.server_port)
+
+
+def get(client):
+    return client.get('test/')
+
+
+def post(client):
+    return client.post('test/', json={'id': 1, 'title': 'title'})
+
+
+def get_many(pool, urls):
+    return pool.get_many(urls)
+
+
+def stream_items(client):
+    return sum(1 for _ in client.stream('test/', items=True, key='data'))
+
+
+def main():
+    runner = get_runner()
+    base_url = start_server()
+    client = ResterClient(base_url)
+    report(runner, [
+        ('client_get', get, client),
+        ('client_post', post, client),
+        ('client_stream_items', stream_items, client),
+        # one benchmark value is a batch of BATCH requests
+        ('pool_get_many_{}'.format(BATCH), get_many,
+         ResterPool(base_url, max_connections=BATCH // 2),
+         ['test/'] * BATCH),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Request/response validation and full dispatch benchmarks.
+
+    python benchmarks/bench_validation.py [-o result.json] [--tracemalloc]
+"""
+import json
+
+from django.test import RequestFactory
+
+from common import (get_runner, report, deep_structure, deep_data,
+                    wide_structure, wide_data)
+from api.views import TestView
+from django_rester import fields
+from django_rester.schema import ValidationPlan
+
+DEPTH, WIDTH = 6, 200
+
+
+def check_json_field(view, data, structure):
+    return view._check_json_field(data, structure)
+
+
+def soft_validation(view, data, plan):
+    return view._add_filtered_data(data, plan(data)[0])
+
+
+def dispatch(view, request_factory):
+    return view(request_factory())
+
+
+def main():
+    runner = get_runner()
+    view = TestView()
+    deep = deep_structure(fields.Int(required=True), DEPTH)
+    wide = wide_structure(fields.Int(required=True), WIDTH)
+    deep_values, wide_values = deep_data(DEPTH), wide_data(WIDTH)
+    # soft validation input: data has fields missing in the structure
+    soft = dict(wide_values, extra={'nested': list(range(10))})
+    rf = RequestFactory()
+    body = json.dumps({'id': 3, 'title': 'title'})
+    report(runner, [
+        ('check_json_field_deep', check_json_field, view, deep_values, deep),
+        ('check_json_field_wide', check_json_field, view, wide_values, wide),
+        ('validation_plan_deep', ValidationPlan(deep), deep_values),
+        ('validation_plan_wide', ValidationPlan(wide), wide_values),
+        ('add_filtered_data_wide', soft_validation, view, soft,
+         ValidationPlan(wide)),
+        ('soft_validation_plan_wide', ValidationPlan(wide).soft, soft),
+        ('dispatch_get', dispatch, TestView.as_view(),
+         lambda: rf.get('/api/test/', {'id': '5', 'title': 'x'})),
+        ('dispatch_post', dispatch, TestView.as_view(),
+         lambda: rf.post('/api/test/', body,
+                         content_type='application/json')),
+    ])
+
+
+if __name__ == '__main__':
+    main()
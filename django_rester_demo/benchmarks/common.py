@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pyperf
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEMO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path[:0] = [DEMO_DIR, os.path.dirname(DEMO_DIR)]
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_rester_demo.settings')
+
+import django
+from django.conf import settings
+
+# benchmarks never touch the demo database
+settings.DATABASES['default']['NAME'] = ':memory:'
+django.setup()
+
+
+def get_runner():
+    runner = pyperf.Runner()
+    runner.metadata['django_rester_settings'] = repr(
+        getattr(settings, 'DJANGO_RESTER', {}))
+    return runner
+
+
+def report(runner, benchmarks):
+    # runs (name, func, *args) benchmarks, prints operations per second,
+    # with --tracemalloc option pyperf measures peak allocated memory
+    # instead of time
+    options = runner.parse_args()
+    for name, func, *args in benchmarks:
+        benchmark = runner.bench_func(name, func, *args)
+        if benchmark is None or options.worker:
+            continue
+        if options.tracemalloc or options.track_memory:
+            print('{}: {:.0f} bytes allocated at peak'.format(
+                name, benchmark.mean()))
+        else:
+            print('{}: {:.0f} ops/s'.format(name, 1 / benchmark.mean()))
+
+
+def deep_structure(field, depth):
+    # {"id": field, "child": {"id": field, "child": ...}, "items": [...]}
+    structure = {'id': field}
+    for _ in range(depth):
+        structure = {'id': field, 'child': structure, 'items': [structure]}
+    return structure
+
+
+def deep_data(depth):
+    data = {'id': 1}
+    for level in range(depth):
+        data = {'id': level, 'child': data, 'items': [data, data]}
+    return data
+
+
+def wide_structure(field, width):
+    return {'field_{}'.format(i): field for i in range(width)}
+
+
+def wide_data(width):
+    return {'field_{}'.format(i): i for i in range(width)}